@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "audio")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def synthesis_key(text, voice_id, preset, params=None, seed=None):
+    """
+    Content address of a synthesized utterance
+    :param text: Text as sent to the model (already normalized)
+    :param voice_id: Identifies the voice and the exact samples it was built from
+    :param preset: Quality preset name
+    :param params: Tuning parameters that change the output
+    :param seed: Deterministic seed, if any
+    """
+    payload = {
+        'text': " ".join(text.split()),
+        'voice': voice_id,
+        'preset': preset,
+        'params': params or {},
+        'seed': seed,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    """
+    Size-bounded on-disk cache of synthesized audio
+    Each entry is a float32 .npy file named after its synthesis key. Recency is
+    tracked with file mtimes, so the LRU order survives restarts, and the least
+    recently used entries are evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._scan()
+
+    def _scan(self):
+        """Rebuild the LRU order from what is on disk"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.npy') and '.tmp' not in name:
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached waveform tensor for key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                audio = np.load(path)
+                os.utime(path)
+            except OSError:
+                self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return torch.from_numpy(audio)
+
+    def put(self, key, audio):
+        """Store a waveform tensor under key, evicting least recently used entries if needed"""
+        if hasattr(audio, 'detach'):
+            audio = audio.detach().cpu().numpy()
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        path = self._path(key)
+
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path[:-4]}.tmp.npy"
+            np.save(tmp_path, audio)
+            os.replace(tmp_path, path)
+
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            size = os.path.getsize(path)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,457 @@
+import io
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+import torch
+
+from wav_stream import IncrementalWavWriter
+
+SAMPLE_RATE = 24000
+
+CONTENT_TYPES = {
+    'wav': 'audio/wav',
+    'pcm': 'audio/L16',
+    'flac': 'audio/flac',
+    'opus': 'audio/ogg',
+    'mp3': 'audio/mpeg',
+}
+
+def to_numpy(audio):
+    """
+    Audio as a float32 array shaped (channels, samples)
+    CPU float32 tensors are shared, not copied.
+    """
+    if hasattr(audio, 'detach'):
+        audio = audio.detach().cpu().numpy()
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim == 1:
+        audio = audio[np.newaxis, :]
+    return audio.reshape(-1, audio.shape[-1])
+
+
+def to_tensor(audio):
+    """Audio as a float32 tensor shaped (channels, samples), sharing memory with arrays"""
+    return torch.from_numpy(np.ascontiguousarray(to_numpy(audio)))
+
+
+def pcm_view(audio, sample_format='int16'):
+    """
+    Interleaved PCM frames as a memoryview
+    float32 mono audio on the CPU is exposed without copying; int16 needs
+    one conversion.
+    :param sample_format: 'int16' or 'float32'
+    """
+    frames = to_numpy(audio).T
+    if sample_format == 'float32':
+        frames = np.ascontiguousarray(frames, dtype='<f4')
+    elif sample_format == 'int16':
+        frames = (np.clip(frames, -1.0, 1.0) * 32767).astype('<i2')
+    else:
+        raise ValueError(f"Unsupported sample format '{sample_format}'")
+    return memoryview(frames.reshape(-1))
+
+
+def find_ffmpeg():
+    """The ffmpeg next to the scripts (as convert_audio.py uses it), else the one on PATH"""
+    if os.path.exists('./ffmpeg'):
+        return './ffmpeg'
+    return shutil.which('ffmpeg')
+
+
+class StreamingResampler:
+    """
+    Windowed-sinc resampler that keeps its state across chunks
+    Output samples whose filter window reaches past the audio seen so far are
+    held back until the next chunk (or flush), so chunk boundaries leave no
+    edges and the total length is exactly round(input * new_freq / orig_freq)
+    however the audio was split.
+    """
+
+    def __init__(self, orig_freq, new_freq, channels=1, half_width=16, max_outputs=16384):
+        """
+        :param half_width: Filter zero crossings on each side; more is sharper and slower
+        :param max_outputs: Output samples computed per step, bounding memory
+        """
+        self.ratio = new_freq / orig_freq
+        # Cut off a little below the lower Nyquist frequency to avoid aliasing
+        self.cutoff = 0.95 * min(1.0, self.ratio)
+        self.width = int(np.ceil(half_width / self.cutoff))
+        self.taps = np.arange(-self.width + 1, self.width + 1)
+        self.max_outputs = max_outputs
+        # Input history, starting with silence before the first sample
+        self.buffer = np.zeros((channels, self.width), dtype=np.float32)
+        self.offset = -self.width
+        self.consumed = 0
+        self.produced = 0
+
+    def _produce(self, count):
+        """The next count output samples, all of whose inputs are buffered"""
+        outputs = []
+        for start in range(self.produced, self.produced + count, self.max_outputs):
+            n = np.arange(start, min(start + self.max_outputs, self.produced + count))
+            t = n / self.ratio
+            base = np.floor(t).astype(np.int64)
+            idx = base[:, None] + self.taps
+            distance = t[:, None] - idx
+            window = 0.5 + 0.5 * np.cos(np.pi * distance / (self.width + 1))
+            weights = (self.cutoff * np.sinc(self.cutoff * distance) * window).astype(np.float32)
+            outputs.append(np.einsum('cmk,mk->cm', self.buffer[:, idx - self.offset], weights))
+        self.produced += count
+        # Keep only the history the next output sample needs
+        keep_from = int(np.floor(self.produced / self.ratio)) - self.width + 1
+        if keep_from > self.offset:
+            self.buffer = self.buffer[:, keep_from - self.offset:]
+            self.offset = keep_from
+        if not outputs:
+            return np.zeros((self.buffer.shape[0], 0), dtype=np.float32)
+        return np.concatenate(outputs, axis=1)
+
+    def process(self, audio):
+        """Resample the next chunk; returns every output sample that can be computed so far"""
+        audio = to_numpy(audio)
+        self.buffer = np.concatenate([self.buffer, audio], axis=1)
+        self.consumed += audio.shape[-1]
+        # Output n needs inputs up to floor(n / ratio) + width
+        available = int(np.ceil((self.consumed - self.width) * self.ratio))
+        while available > 0 and np.floor((available - 1) / self.ratio) + self.width >= self.consumed:
+            available -= 1
+        return self._produce(max(0, available - self.produced))
+
+    def flush(self):
+        """The held back tail, computed against trailing silence"""
+        total = int(round(self.consumed * self.ratio))
+        self.buffer = np.concatenate([self.buffer, np.zeros((self.buffer.shape[0], self.width + 1), np.float32)],
+                                     axis=1)
+        return self._produce(max(0, total - self.produced))
+
+
+class PcmEncoder:
+    """Raw 16-bit little endian PCM"""
+
+    def __init__(self, sink, sample_rate=SAMPLE_RATE, channels=1, bitrate=None, output_rate=None):
+        """
+        :param sink: Binary file object the encoded audio is written to
+        :param sample_rate: Sample rate of the audio passed to write
+        :param channels: Number of channels
+        :param bitrate: Target bitrate, e.g. '64k' (only used by compressed formats)
+        :param output_rate: Sample rate to encode at (default: sample_rate)
+        """
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.output_rate = output_rate or sample_rate
+        # One resampler for the whole stream, so chunk boundaries are seamless
+        self.resampler = None
+        if self.output_rate != sample_rate:
+            self.resampler = StreamingResampler(sample_rate, self.output_rate, channels)
+
+    def _resampled(self, audio):
+        return self.resampler.process(audio) if self.resampler is not None else audio
+
+    def _write(self, audio):
+        self.sink.write(pcm_view(audio, 'int16'))
+
+    def write(self, audio):
+        self._write(self._resampled(audio))
+
+    def close(self):
+        if self.resampler is not None:
+            self._write(self.resampler.flush())
+        self.sink.flush()
+
+
+class WavEncoder(PcmEncoder):
+    """WAV, float32 like torchaudio.save writes it; sample_format='int16' halves the size"""
+
+    def __init__(self, sink, sample_rate=SAMPLE_RATE, channels=1, bitrate=None, output_rate=None,
+                 sample_format='float32'):
+        super().__init__(sink, sample_rate, channels, bitrate, output_rate)
+        self.writer = IncrementalWavWriter(sink, self.output_rate, channels, sample_format)
+
+    def _write(self, audio):
+        self.writer.write(audio)
+
+    def close(self):
+        if self.resampler is not None:
+            self._write(self.resampler.flush())
+        self.writer.close()
+
+
+class FfmpegEncoder:
+    """
+    Compressed formats through one ffmpeg process per output
+    Raw PCM goes in on stdin as it is written and the encoded stream is copied
+    to the sink from stdout, so the output is a single stream rather than one
+    per chunk. ffmpeg does the resampling.
+    """
+
+    container = None
+    codec = None
+
+    def __init__(self, sink, sample_rate=SAMPLE_RATE, channels=1, bitrate=None, output_rate=None):
+        ffmpeg = find_ffmpeg()
+        if ffmpeg is None:
+            raise RuntimeError(f"Encoding to {self.codec} needs ffmpeg")
+        command = [
+            ffmpeg, '-hide_banner', '-loglevel', 'error',
+            '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+            '-c:a', self.codec,
+        ]
+        if bitrate:
+            command += ['-b:a', str(bitrate)]
+        if output_rate and output_rate != sample_rate:
+            command += ['-ar', str(output_rate)]
+        command += ['-f', self.container, 'pipe:1']
+
+        self.sink = sink
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        self._stderr = b''
+        self._readers = [
+            threading.Thread(target=self._copy_output, daemon=True),
+            threading.Thread(target=self._read_errors, daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def _copy_output(self):
+        for data in iter(lambda: self.process.stdout.read(65536), b''):
+            self.sink.write(data)
+
+    def _read_errors(self):
+        self._stderr = self.process.stderr.read()
+
+    def write(self, audio):
+        try:
+            self.process.stdin.write(pcm_view(audio, 'float32'))
+        except BrokenPipeError:
+            self.close()
+
+    def close(self):
+        if not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        for reader in self._readers:
+            reader.join()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.codec}: {self._stderr.decode(errors='replace').strip()}")
+        self.sink.flush()
+
+
+class FlacEncoder(FfmpegEncoder):
+    container, codec = 'flac', 'flac'
+
+
+class OpusEncoder(FfmpegEncoder):
+    container, codec = 'ogg', 'libopus'
+
+
+class Mp3Encoder(FfmpegEncoder):
+    container, codec = 'mp3', 'libmp3lame'
+
+
+# Output format -> encoder class; see register_encoder
+ENCODERS = {
+    'wav': WavEncoder,
+    'pcm': PcmEncoder,
+    'flac': FlacEncoder,
+    'opus': OpusEncoder,
+    'mp3': Mp3Encoder,
+}
+
+# File extension -> output format
+EXTENSIONS = {
+    '.wav': 'wav',
+    '.pcm': 'pcm',
+    '.raw': 'pcm',
+    '.flac': 'flac',
+    '.opus': 'opus',
+    '.ogg': 'opus',
+    '.mp3': 'mp3',
+}
+
+
+def register_encoder(fmt, encoder, content_type='application/octet-stream', extension=None):
+    """
+    Add an output format
+    :param encoder: Class taking (sink, sample_rate, channels, bitrate, output_rate)
+                    with write(audio) and close()
+    """
+    ENCODERS[fmt] = encoder
+    CONTENT_TYPES[fmt] = content_type
+    if extension:
+        EXTENSIONS[extension] = fmt
+
+
+def format_for_path(path, default='wav'):
+    """Output format implied by a file name, or default for unknown extensions"""
+    return EXTENSIONS.get(os.path.splitext(str(path))[1].lower(), default)
+
+
+def get_encoder(fmt, sink, sample_rate=SAMPLE_RATE, channels=1, bitrate=None, output_rate=None):
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown output format '{fmt}', expected one of {', '.join(ENCODERS)}")
+    return ENCODERS[fmt](sink, sample_rate, channels, bitrate, output_rate)
+
+
+def encode_audio(audio, sample_rate=SAMPLE_RATE, fmt='wav', bitrate=None, output_rate=None):
+    """
+    Encode audio in memory
+    :param fmt: 'wav' (float32), 'pcm' (raw 16-bit little endian), 'flac', 'opus',
+                'mp3' or a registered format
+    :param bitrate: Target bitrate of compressed formats, e.g. '32k'
+    :param output_rate: Sample rate to encode at (default: sample_rate)
+    :return: bytes
+    """
+    buffer = io.BytesIO()
+    encoder = get_encoder(fmt, buffer, sample_rate, to_numpy(audio).shape[0], bitrate, output_rate)
+    encoder.write(audio)
+    encoder.close()
+    return buffer.getvalue()
+
+
+class EncodingPipeline:
+    """
+    Encodes audio on a background thread while the caller renders the next chunk
+    write() only queues the chunk; close() waits for the encoder to finish.
+
+    with EncodingPipeline("out.opus", 'opus', bitrate='32k') as pipeline:
+        for chunk in chunks:
+            pipeline.write(chunk)
+    """
+
+    def __init__(self, path=None, fmt=None, sample_rate=SAMPLE_RATE, bitrate=None, output_rate=None,
+                 channels=1, max_pending=8):
+        """
+        :param path: Output file, a binary file object (left open on close), or
+                     None to collect the encoded audio in memory
+        :param fmt: Output format (default: from the file extension, else wav)
+        :param sample_rate: Sample rate of the audio passed to write
+        :param bitrate: Target bitrate of compressed formats, e.g. '32k'
+        :param output_rate: Sample rate to encode at (default: sample_rate)
+        :param max_pending: Chunks that may wait for the encoder before write blocks
+        """
+        self.fmt = fmt or (format_for_path(path) if isinstance(path, (str, os.PathLike)) else 'wav')
+        self.path = path
+        self.sample_rate = sample_rate
+        self.frames_written = 0
+        self.result = None
+        self.error = None
+        self._owns_file = not hasattr(path, 'write')
+        if path is None:
+            self._file = io.BytesIO()
+        elif self._owns_file:
+            self._file = open(path, 'wb')
+        else:
+            self._file = path
+        try:
+            self.encoder = get_encoder(self.fmt, self._file, sample_rate, channels, bitrate, output_rate)
+        except Exception:
+            # e.g. no ffmpeg: don't leave an empty file behind
+            if self._owns_file:
+                self._file.close()
+                self._remove_output()
+            raise
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def duration(self):
+        """Seconds of audio written so far"""
+        return self.frames_written / self.sample_rate
+
+    def _remove_output(self):
+        if self._owns_file and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _run(self):
+        while True:
+            audio = self._queue.get()
+            if audio is None:
+                break
+            if self.error is None:
+                try:
+                    self.encoder.write(audio)
+                except Exception as e:
+                    # Keep draining so writers never block on a dead encoder
+                    self.error = e
+
+    def write(self, audio):
+        """
+        Queue audio for encoding
+        :param audio: Tensor or array shaped (channels, samples) or (samples,), float in [-1, 1]
+        """
+        if self.error is not None:
+            raise self.error
+        audio = to_numpy(audio)
+        self._queue.put(audio)
+        self.frames_written += audio.shape[-1]
+
+    def close(self):
+        """
+        Finish encoding
+        :return: The encoded bytes when collecting in memory, else the output path
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+            try:
+                if self.error is None:
+                    self.encoder.close()
+            except Exception as e:
+                self.error = e
+            finally:
+                if self.path is None:
+                    self.result = self._file.getvalue()
+                else:
+                    self.result = self.path
+                    if self._owns_file:
+                        self._file.close()
+                        if self.error is not None:
+                            # A half-encoded file is of no use
+                            self._remove_output()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def discard(self):
+        """Stop encoding and remove the output file (when the pipeline opened it)"""
+        try:
+            self.close()
+        except Exception:
+            pass
+        self._remove_output()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't hide the original error behind an encoding one
+            try:
+                self.close()
+            except Exception:
+                pass
+
+
+def convert_output(audio, output='tensor', sample_rate=SAMPLE_RATE):
+    """
+    Hand synthesized audio back in the form the caller asked for
+    :param output: 'tensor', 'numpy', 'pcm' (memoryview of 16-bit PCM), or an
+                   encoded format from encode_audio ('wav', 'flac', 'opus', 'mp3')
+    """
+    if output == 'tensor':
+        return to_tensor(audio)
+    if output == 'numpy':
+        return to_numpy(audio)
+    if output == 'pcm':
+        return pcm_view(audio, 'int16')
+    return encode_audio(audio, sample_rate, output)
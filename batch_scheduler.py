@@ -0,0 +1,131 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _Request:
+    def __init__(self, text, voice, preset, params):
+        self.text = text
+        self.voice = voice
+        self.preset = preset
+        self.params = params
+        self.future = Future()
+        self.arrived = time.time()
+
+    def group_key(self):
+        """Requests can only share a batch if everything but the text matches"""
+        voice = tuple(self.voice) if isinstance(self.voice, list) else self.voice
+        return voice, self.preset, json.dumps(self.params, sort_keys=True, default=str)
+
+
+class MicroBatchScheduler:
+    """
+    Collects concurrent synthesis requests and renders them as batches
+    The first request opens a window; everything that arrives before the window
+    closes (or until the batch is full) goes through Engine.synthesize_batch
+    together, and each caller gets its own waveform back through a Future.
+    """
+
+    def __init__(self, engine, max_wait_ms=50, max_batch_size=8, max_batch_chars=None, memory_budget_mb=None):
+        """
+        :param engine: Engine to render with
+        :param max_wait_ms: Longest a request waits for others to join its batch (the latency ceiling)
+        :param max_batch_size: Maximum number of requests per batch
+        :param max_batch_chars: Stop collecting once the batch holds this many characters of text
+        :param memory_budget_mb: Passed to Engine.synthesize_batch
+        """
+        self.engine = engine
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.memory_budget_mb = memory_budget_mb
+        self.batches_run = 0
+        self.requests_run = 0
+        self.requests_joined = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, text, voice, preset='fast', **params):
+        """
+        Queue a request
+        A request identical to one the engine is rendering right now joins
+        that render instead of queuing behind it.
+        :return: Future resolving to a waveform tensor of shape (1, samples)
+        """
+        try:
+            future = self.engine.inflight(text, voice, preset, **params)
+        except ValueError:
+            # Unknown voice or preset: the batch reports it through the future
+            future = None
+        if future is not None:
+            self.requests_joined += 1
+            return future
+        request = _Request(text, voice, preset, params)
+        self._queue.put(request)
+        return request.future
+
+    def synthesize(self, text, voice, preset='fast', **params):
+        """Blocking convenience wrapper around submit"""
+        return self.submit(text, voice, preset, **params).result()
+
+    def _collect(self):
+        """Block for one request, then gather more until the window closes or the batch is full"""
+        batch = [self._queue.get()]
+        deadline = batch[0].arrived + self.max_wait
+        chars = len(batch[0].text)
+        while len(batch) < self.max_batch_size:
+            if self.max_batch_chars is not None and chars >= self.max_batch_chars:
+                break
+            # Past the deadline only requests that are already waiting are taken
+            timeout = deadline - time.time()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            chars += len(request.text)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.group_key(), []).append(request)
+
+            for requests in groups.values():
+                first = requests[0]
+                try:
+                    # A chunk that fails inside the batch only fails its own request
+                    audio = self.engine.synthesize_batch(
+                        [request.text for request in requests], first.voice,
+                        preset=first.preset,
+                        batch_size=len(requests),
+                        memory_budget_mb=self.memory_budget_mb,
+                        return_exceptions=True,
+                        **first.params
+                    )
+                except Exception as e:
+                    # Shared by the whole group (unknown voice, bad settings)
+                    for request in requests:
+                        request.future.set_exception(e)
+                    continue
+                for request, waveform in zip(requests, audio):
+                    if isinstance(waveform, Exception):
+                        request.future.set_exception(waveform)
+                    else:
+                        request.future.set_result(waveform)
+                self.batches_run += 1
+                self.requests_run += len(requests)
+
+    def stats(self):
+        return {
+            'batches': self.batches_run,
+            'requests': self.requests_run,
+            'joined': self.requests_joined,
+            'mean_batch_size': self.requests_run / self.batches_run if self.batches_run else 0.0,
+            'queued': self._queue.qsize(),
+        }
@@ -0,0 +1,169 @@
+from contextlib import nullcontext
+
+import torch
+import torch.nn.functional as F
+
+# Autoregressive model size, used to estimate the KV cache of a batch
+AR_LAYERS = 30
+AR_MODEL_DIM = 1024
+CALM_TOKEN = 83
+
+
+def estimate_batch_memory_mb(num_texts, text_length, sequences_per_text, max_mel_tokens, bytes_per_value=4):
+    """
+    Rough peak memory of one batched autoregressive pass
+    Dominated by the key/value cache: 2 tensors per layer for every generated
+    sequence and every position.
+    """
+    positions = text_length + max_mel_tokens + 2
+    sequences = num_texts * sequences_per_text
+    kv_bytes = 2 * AR_LAYERS * AR_MODEL_DIM * bytes_per_value * positions * sequences
+    return kv_bytes / (1024 * 1024)
+
+
+def plan_batches(texts, batch_size, memory_budget_mb=None, sequences_per_text=1, max_mel_tokens=500):
+    """
+    Group chunk indices into batches
+    Chunks are sorted by length so a batch pads as little as possible, and a
+    batch is closed early when it would go over the memory budget.
+    :return: List of lists of indices into texts
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = []
+    current = []
+    for idx in order:
+        candidate = current + [idx]
+        longest = max(len(texts[i]) for i in candidate)
+        over_budget = (
+            memory_budget_mb is not None and len(current) > 0 and
+            estimate_batch_memory_mb(len(candidate), longest, sequences_per_text, max_mel_tokens) > memory_budget_mb
+        )
+        if len(current) >= batch_size or over_budget:
+            batches.append(current)
+            current = [idx]
+        else:
+            current = candidate
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _encode_batch(tts, texts):
+    """Tokenize texts and pad them to a common length with the stop token"""
+    token_lists = [tts.tokenizer.encode(text) + [0] for text in texts]
+    for tokens in token_lists:
+        assert len(tokens) < 400, 'Too much text provided. Break the text up into separate segments and re-try inference.'
+    stop_text_token = tts.autoregressive.stop_text_token
+    longest = max(len(tokens) for tokens in token_lists)
+    padded = torch.full((len(texts), longest), stop_text_token, dtype=torch.int32)
+    for i, tokens in enumerate(token_lists):
+        padded[i, :len(tokens)] = torch.IntTensor(tokens)
+    singles = [torch.IntTensor(tokens).unsqueeze(0).to(tts.device) for tokens in token_lists]
+    return padded.to(tts.device), singles
+
+
+def _on_device(tts, model):
+    """
+    Context that puts a model on tts.device for one stage
+    Tortoise 3 keeps its models on the CPU and moves each one to the GPU only
+    while it runs (TextToSpeech.temporary_cuda); older versions load them on
+    the device up front.
+    """
+    if hasattr(tts, 'temporary_cuda'):
+        return tts.temporary_cuda(model)
+    return nullcontext(model)
+
+
+def tts_batch(tts, texts, conditioning_latents, k=1, verbose=False, use_deterministic_seed=None,
+              num_autoregressive_samples=16, temperature=.8, length_penalty=1.0, repetition_penalty=2.0,
+              top_p=.8, max_mel_tokens=500, cvvp_amount=.0, diffusion_iterations=30, cond_free=True,
+              cond_free_k=2.0, diffusion_temperature=1.0, **hf_generate_kwargs):
+    """
+    Run several texts through Tortoise together
+    Mirrors TextToSpeech.tts, except the autoregressive stage - the most
+    expensive one - samples every text of the batch in the same forward passes.
+    CLVP ranking, diffusion and the vocoder then run per text, one stage at a
+    time so each model moves to the device once per batch.
+    :return: One waveform tensor of shape (1, 1, samples) per text (a list of k when k > 1)
+    """
+    from tortoise.api import do_spectrogram_diffusion, fix_autoregressive_output, load_discrete_vocoder_diffuser
+
+    if use_deterministic_seed is not None:
+        tts.deterministic_state(seed=use_deterministic_seed)
+    if cvvp_amount:
+        raise NotImplementedError("CVVP re-ranking is not supported in batched mode")
+
+    auto_conditioning, diffusion_conditioning = conditioning_latents
+    auto_conditioning = auto_conditioning.to(tts.device)
+    diffusion_conditioning = diffusion_conditioning.to(tts.device)
+    text_batch, text_singles = _encode_batch(tts, texts)
+    diffuser = load_discrete_vocoder_diffuser(desired_diffusion_steps=diffusion_iterations, cond_free=cond_free, cond_free_k=cond_free_k)
+    stop_mel_token = tts.autoregressive.stop_mel_token
+    sequences_per_pass = min(tts.autoregressive_batch_size, num_autoregressive_samples)
+    num_passes = max(1, num_autoregressive_samples // sequences_per_pass)
+    half = getattr(tts, 'half', False)
+
+    results = []
+    with torch.no_grad():
+        # Autoregressive sampling: one generate() call covers every text.
+        # Outputs come back grouped per text, sequences_per_pass rows each
+        samples = [[] for _ in texts]
+        with _on_device(tts, tts.autoregressive) as autoregressive, \
+                torch.autocast(device_type="cuda", dtype=torch.float16, enabled=half):
+            for _ in range(num_passes):
+                codes = autoregressive.inference_speech(
+                    auto_conditioning.repeat(len(texts), 1), text_batch,
+                    do_sample=True, top_p=top_p, temperature=temperature,
+                    num_return_sequences=sequences_per_pass,
+                    length_penalty=length_penalty, repetition_penalty=repetition_penalty,
+                    max_generate_length=max_mel_tokens, **hf_generate_kwargs
+                )
+                codes = F.pad(codes, (0, max_mel_tokens - codes.shape[1]), value=stop_mel_token)
+                for i, text_codes in enumerate(codes.split(sequences_per_pass, dim=0)):
+                    samples[i].append(text_codes)
+
+        # CLVP ranking, per text
+        best = []
+        with _on_device(tts, tts.clvp) as clvp, \
+                torch.autocast(device_type="cuda", dtype=torch.float16, enabled=half):
+            for text_tokens, text_samples in zip(text_singles, samples):
+                text_samples = torch.cat(text_samples, dim=0)
+                for i in range(text_samples.shape[0]):
+                    text_samples[i] = fix_autoregressive_output(text_samples[i], stop_mel_token)
+                clvp_out = clvp(text_tokens.repeat(text_samples.shape[0], 1), text_samples, return_loss=False)
+                best.append(text_samples[torch.topk(clvp_out, k=k).indices])
+
+        # Latents of the chosen samples, the diffusion model's conditioning
+        best_latents = []
+        with _on_device(tts, tts.autoregressive) as autoregressive, \
+                torch.autocast(device_type="cuda", dtype=torch.float16, enabled=half):
+            for text_tokens, best_results in zip(text_singles, best):
+                best_latents.append(autoregressive(
+                    auto_conditioning.repeat(k, 1), text_tokens.repeat(k, 1),
+                    torch.tensor([text_tokens.shape[-1]], device=text_tokens.device), best_results,
+                    torch.tensor([best_results.shape[-1] * tts.autoregressive.mel_length_compression], device=text_tokens.device),
+                    return_latent=True, clip_inputs=False
+                ))
+
+        with _on_device(tts, tts.diffusion) as diffusion, _on_device(tts, tts.vocoder) as vocoder:
+            for text, best_results, text_latents in zip(texts, best, best_latents):
+                wav_candidates = []
+                for b in range(best_results.shape[0]):
+                    codes = best_results[b].unsqueeze(0)
+                    latents = text_latents[b].unsqueeze(0)
+                    # Trim after a run of "calm" tokens, like TextToSpeech.tts does
+                    calm_tokens = 0
+                    for j in range(codes.shape[-1]):
+                        calm_tokens = calm_tokens + 1 if codes[0, j] == CALM_TOKEN else 0
+                        if calm_tokens > 8:
+                            latents = latents[:, :j]
+                            break
+                    mel = do_spectrogram_diffusion(diffusion, diffuser, latents, diffusion_conditioning,
+                                                   temperature=diffusion_temperature, verbose=verbose)
+                    wav = vocoder.inference(mel)
+                    if tts.enable_redaction:
+                        wav = tts.aligner.redact(wav.squeeze(1), text).unsqueeze(1)
+                    wav_candidates.append(wav.cpu())
+
+                results.append(wav_candidates if len(wav_candidates) > 1 else wav_candidates[0])
+    return results
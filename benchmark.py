@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Time every stage of the synthesis pipeline
+Runs generate_voice (easy_tts.py), SpanishTTSColab.generate_speech and the
+tortoise_tts.py clip loop and reports, per run, how long model load, sample
+load, conditioning, the autoregressive pass, CLVP ranking, diffusion, the
+vocoder, concatenation and saving took. Stages are timed by wrapping the
+functions that implement them, so the entry points run unchanged.
+
+Uses the Tortoise checkpoints when tortoise is installed and they are on
+disk, otherwise the small deterministic models of stub_tortoise.py, which
+need no network. The JSON report can be saved with --output and passed back
+with --baseline to see how a change moved each stage.
+"""
+
+import argparse
+import functools
+import importlib.util
+import json
+import os
+import platform
+import runpy
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import torch
+
+from runtime_config import get_runtime_plan
+from wav_stream import IncrementalWavWriter
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TORTOISE_SCRIPT = os.path.join(REPO_DIR, 'venv310', 'Scripts', 'tortoise_tts.py')
+COLAB_DIR = os.path.join(REPO_DIR, 'spanish-voice-clone')
+
+TARGETS = ('generate_voice', 'colab', 'tortoise_tts')
+STAGES = ('model_load', 'sample_load', 'conditioning', 'autoregressive', 'clvp', 'diffusion', 'vocoder',
+          'concat', 'save')
+
+DEFAULT_TEXT = ("Hola, ¿cómo estás? Espero que tengas un buen día. El tren sale a las 8:30 desde el andén "
+                "número 3, así que no llegues tarde. Gracias por su paciencia, en un momento lo atendemos.")
+
+
+class StageTimer:
+    """
+    Wall time per pipeline stage, collected by wrapping the functions of each stage
+    Only the outermost timed call on a thread counts, so stages never overlap:
+    a torch.cat inside diffusion is diffusion, not concat.
+    """
+
+    def __init__(self, device='cpu'):
+        self.sync = device.startswith('cuda') and torch.cuda.is_available()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def timed(self, stage, function):
+        timer = self
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if getattr(timer._local, 'active', False):
+                return function(*args, **kwargs)
+            timer._local.active = True
+            if timer.sync:
+                torch.cuda.synchronize()
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if timer.sync:
+                    torch.cuda.synchronize()
+                timer.seconds[stage] = timer.seconds.get(stage, 0.0) + time.perf_counter() - start_time
+                timer.calls[stage] = timer.calls.get(stage, 0) + 1
+                timer._local.active = False
+
+        wrapper._stage = stage
+        return wrapper
+
+    def patch(self, owner, name, stage):
+        """Time every call of owner.name from now on"""
+        function = getattr(owner, name)
+        if getattr(function, '_stage', None) is None:
+            setattr(owner, name, self.timed(stage, function))
+
+    def instrument_models(self, tts):
+        """Time the model calls of a TextToSpeech; done again after quantization swaps models"""
+        self.patch(tts.autoregressive, 'inference_speech', 'autoregressive')
+        self.patch(tts.autoregressive, 'forward', 'autoregressive')
+        self.patch(tts.clvp, 'forward', 'clvp')
+        self.patch(tts.vocoder, 'inference', 'vocoder')
+        return tts
+
+    def install(self):
+        """Wrap the functions of every stage (tortoise must be importable)"""
+        import audio_output
+        import quantization
+        import tortoise.api
+        import tortoise.utils.audio
+        import torchaudio
+        import voice_store
+
+        timer = self
+        tts_class = tortoise.api.TextToSpeech
+        init = tts_class.__init__
+
+        @functools.wraps(init)
+        def timed_init(tts, *args, **kwargs):
+            init(tts, *args, **kwargs)
+            timer.instrument_models(tts)
+
+        tts_class.__init__ = self.timed('model_load', timed_init)
+        quantize_tts = quantization.quantize_tts
+        quantization.quantize_tts = self.timed(
+            'model_load', lambda tts, *args, **kwargs: timer.instrument_models(quantize_tts(tts, *args, **kwargs)))
+
+        self.patch(tts_class, 'get_conditioning_latents', 'conditioning')
+        self.patch(tortoise.api, 'do_spectrogram_diffusion', 'diffusion')
+        self.patch(voice_store, 'load_sample', 'sample_load')
+        self.patch(tortoise.utils.audio, 'load_audio', 'sample_load')
+        self.patch(tortoise.utils.audio, 'load_voices', 'sample_load')
+        self.patch(torch, 'cat', 'concat')
+        self.patch(torchaudio, 'save', 'save')
+        # The encoder itself runs on a background thread; what is timed here
+        # is how long the renderer waits for it
+        self.patch(audio_output.EncodingPipeline, 'write', 'save')
+        self.patch(audio_output.EncodingPipeline, 'close', 'save')
+
+    def report(self, total_seconds):
+        stages = {
+            stage: {'seconds': round(self.seconds[stage], 4), 'calls': self.calls[stage]}
+            for stage in STAGES if stage in self.seconds
+        }
+        stages['other'] = {'seconds': round(max(0.0, total_seconds - sum(self.seconds.values())), 4), 'calls': 1}
+        return stages
+
+
+def tortoise_available(models_dir=None):
+    """True when the real tortoise package and its autoregressive checkpoint are both present"""
+    try:
+        if importlib.util.find_spec('tortoise.api') is None:
+            return False
+    except ModuleNotFoundError:
+        return False
+    from tortoise.api import MODELS_DIR
+
+    return os.path.exists(os.path.join(models_dir or MODELS_DIR, 'autoregressive.pth'))
+
+
+def wav_duration(path):
+    """Seconds of audio in a WAV file, read from its header (any sample format)"""
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            return None
+        byte_rate = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                byte_rate = struct.unpack('<HHII', f.read(12))[3]
+                f.seek(size - 12, 1)
+            elif chunk_id == b'data':
+                return size / byte_rate if byte_rate else None
+            else:
+                f.seek(size + size % 2, 1)
+
+
+def write_synthetic_samples(voice_dir, count=3, seconds=4, sample_rate=22050):
+    """Deterministic stand-in voice samples: a voiced tone with vibrato and a little noise"""
+    rng = np.random.default_rng(0)
+    t = np.arange(seconds * sample_rate) / sample_rate
+    paths = []
+    for i in range(count):
+        pitch = 110 + 20 * i + 5 * np.sin(2 * np.pi * 5 * t)
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        audio = sum(np.sin(h * phase) / h for h in range(1, 6)) * 0.2 + rng.normal(0, 0.01, t.shape)
+        paths.append(os.path.join(voice_dir, f'sample_{i:02d}.wav'))
+        with IncrementalWavWriter(paths[-1], sample_rate, sample_format='int16') as writer:
+            writer.write(audio.astype(np.float32))
+    return paths
+
+
+def prepare_voice(voice, voices_root):
+    """
+    Copy a voice into a scratch directory, so every run starts without cached
+    latents and no cache of the real voice is touched
+    :return: The scratch voice directory (named 'bench')
+    """
+    from tts_engine import list_voice_samples, resolve_voice_dir
+
+    voice_dir = os.path.join(voices_root, 'bench')
+    os.makedirs(voice_dir, exist_ok=True)
+    metadata = {}
+    source_paths = []
+    try:
+        source_dir = resolve_voice_dir(voice) if voice else None
+    except ValueError:
+        source_dir = None
+    if source_dir:
+        source_paths = list_voice_samples(source_dir)
+        metadata_path = os.path.join(source_dir, 'metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+
+    if source_paths:
+        paths = []
+        for i, path in enumerate(source_paths):
+            paths.append(os.path.join(voice_dir, f'sample_{i:02d}.wav'))
+            shutil.copyfile(path, paths[-1])
+    else:
+        print(f"No samples found for voice '{voice}', using synthetic samples")
+        paths = write_synthetic_samples(voice_dir)
+
+    # Keep the voice's presets but not its cache location
+    settings = dict(metadata.get('settings', {}))
+    settings.pop('conditioning_latents_cache_path', None)
+    metadata = {
+        'language': metadata.get('language', 'es'),
+        'samples': [{'file': os.path.basename(path), 'language': 'es'} for path in paths],
+        'settings': settings,
+    }
+    with open(os.path.join(voice_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    return voice_dir
+
+
+def fresh_engine(precision):
+    """A new process-wide engine without the audio cache, so every run synthesizes"""
+    import easy_tts
+    import latents_cache
+    import tts_engine
+
+    latents_cache._latents_memo.clear()
+    tts_engine._engine = tts_engine.Engine(audio_cache=None, **easy_tts.engine_settings(precision))
+
+
+def run_generate_voice(text, voice_dir, output_dir, args):
+    import easy_tts
+
+    easy_tts.VOICE_DIR = voice_dir
+    return easy_tts.generate_voice(text, args.preset, os.path.join(output_dir, 'generate_voice.wav'),
+                                   chunk_size=args.chunk_size, precision=args.precision)
+
+
+def run_colab(text, voice_dir, output_dir, args):
+    if COLAB_DIR not in sys.path:
+        sys.path.insert(0, COLAB_DIR)
+    from colab_tts import SpanishTTSColab
+
+    return SpanishTTSColab(voice_dir).generate_speech(text, args.preset, os.path.join(output_dir, 'colab.wav'),
+                                                      use_deterministic_seed=args.seed)
+
+
+def run_tortoise_tts(text, voice_dir, output_dir, args):
+    output_path = os.path.join(output_dir, 'tortoise_tts.wav')
+    argv = [TORTOISE_SCRIPT, '-o, --output', output_path, '-v, --voice', os.path.basename(voice_dir),
+            '-V, --voices-dir', os.path.dirname(voice_dir), '-p, --preset', args.preset,
+            '--seed', str(args.seed), '-q, --quiet', text]
+    if args.device:
+        argv += ['--device', args.device]
+    if args.precision:
+        argv += ['--precision', args.precision]
+    saved_argv = sys.argv
+    sys.argv = argv
+    try:
+        runpy.run_path(TORTOISE_SCRIPT, run_name='__main__')
+    except SystemExit as e:
+        if e.code:
+            raise RuntimeError(f"tortoise_tts.py exited with status {e.code}")
+    finally:
+        sys.argv = saved_argv
+    return output_path
+
+
+RUNNERS = {
+    'generate_voice': run_generate_voice,
+    'colab': run_colab,
+    'tortoise_tts': run_tortoise_tts,
+}
+
+
+def benchmark(targets, text, args):
+    timer = StageTimer(args.device or get_runtime_plan().device)
+    timer.install()
+    work_dir = tempfile.mkdtemp(prefix='tts_benchmark_')
+    results = {}
+    try:
+        for target in targets:
+            print(f"\n=== {target} ===")
+            voice_dir = prepare_voice(args.voice, os.path.join(work_dir, target, 'voices'))
+            # Models and latents are loaded again for every target; later
+            # repeats show the warm cost
+            fresh_engine(args.precision)
+            runs = []
+            for repeat in range(args.repeat):
+                output_dir = os.path.join(work_dir, target, f'run{repeat}')
+                os.makedirs(output_dir, exist_ok=True)
+                torch.manual_seed(args.seed)
+                timer.reset()
+                start_time = time.perf_counter()
+                error = None
+                try:
+                    output_path = RUNNERS[target](text, voice_dir, output_dir, args)
+                    if not output_path or not os.path.exists(output_path):
+                        error = "no output was written"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {str(e)}"
+                total_seconds = time.perf_counter() - start_time
+                run = {'total_seconds': round(total_seconds, 4), 'stages': timer.report(total_seconds)}
+                if error:
+                    run['error'] = error
+                    print(f"{target} failed: {error}")
+                else:
+                    audio_seconds = wav_duration(output_path)
+                    run['audio_seconds'] = round(audio_seconds, 3) if audio_seconds else None
+                    run['real_time_factor'] = round(total_seconds / audio_seconds, 4) if audio_seconds else None
+                runs.append(run)
+            results[target] = {'runs': runs}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare_to_baseline(report, baseline):
+    """Speedup of the last (warmest) run of each target and stage over the baseline; > 1 is faster"""
+    comparison = {}
+    for target, result in report['targets'].items():
+        base = baseline.get('targets', {}).get(target)
+        if not base or not base['runs'] or not result['runs']:
+            continue
+        current, previous = result['runs'][-1], base['runs'][-1]
+        speedups = {'total': round(previous['total_seconds'] / current['total_seconds'], 3)}
+        for stage, stats in current['stages'].items():
+            previous_stats = previous['stages'].get(stage)
+            if previous_stats and stats['seconds'] > 0:
+                speedups[stage] = round(previous_stats['seconds'] / stats['seconds'], 3)
+        comparison[target] = speedups
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each stage of the synthesis pipeline and print a JSON report.')
+    parser.add_argument('--targets', default=','.join(TARGETS), help=f'Comma-separated entry points ({", ".join(TARGETS)}).')
+    parser.add_argument('--models', default='auto', choices=['auto', 'real', 'stub'],
+                        help='Real Tortoise checkpoints, the stub models, or real ones when available.')
+    parser.add_argument('--models-dir', default=None, help='Where to look for the Tortoise checkpoints.')
+    parser.add_argument('--voice', default='tortoise/voices/juan',
+                        help='Voice name or directory; synthetic samples are used if it has none.')
+    parser.add_argument('--preset', default='ultra_fast', help='Preset to render with.')
+    parser.add_argument('--text', default=DEFAULT_TEXT, help='Text to render.')
+    parser.add_argument('--chunk-size', type=int, default=100, help='Chunk size for generate_voice.')
+    parser.add_argument('--repeat', type=int, default=2, help='Runs per target; the first includes loading the models.')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed for every run.')
+    parser.add_argument('--device', default=None, help='Device for inference (detected if omitted).')
+    parser.add_argument('--precision', default=None, choices=['float32', 'half', 'int8'],
+                        help='Model precision (detected if omitted; the stub models always use float32).')
+    parser.add_argument('--output', default=None, help='Also write the JSON report to this file.')
+    parser.add_argument('--baseline', default=None, help='Earlier JSON report to compare against.')
+    args = parser.parse_args()
+
+    targets = args.targets.split(',')
+    for target in targets:
+        if target not in RUNNERS:
+            parser.error(f"unknown target '{target}', expected one of {', '.join(TARGETS)}")
+
+    use_stub = args.models == 'stub' or (args.models == 'auto' and not tortoise_available(args.models_dir))
+    if use_stub:
+        import stub_tortoise
+
+        stub_tortoise.install()
+        # Quantizing would write the stub models into the shared int8 cache
+        args.precision = 'float32'
+        print("Using the stub models; timings are for the pipeline around the models, not the models themselves")
+    elif not tortoise_available(args.models_dir):
+        parser.error("--models real needs tortoise and its checkpoints")
+    plan = get_runtime_plan(device=args.device, precision=args.precision)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'models': 'stub' if use_stub else 'real',
+        'device': plan.device,
+        'precision': plan.precision,
+        'threads': torch.get_num_threads(),
+        'torch': torch.__version__,
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'preset': args.preset,
+        'text_characters': len(args.text),
+        'targets': benchmark(targets, args.text, args),
+    }
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report['speedup_vs_baseline'] = compare_to_baseline(report, json.load(f))
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
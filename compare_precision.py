@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Compare generation speed and output of the model precisions on this machine
+Renders the same sentences with the same seed at every precision, writes the
+audio for listening and prints a JSON report with the real-time factor and how
+far each precision's output is from the float32 reference.
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+
+import torch
+
+from quantization import PRECISIONS, precision_settings
+from spanish_text import normalize_spanish_text
+from tts_engine import Engine
+from wav_stream import IncrementalWavWriter
+
+SAMPLE_RATE = 24000
+
+DEFAULT_TEXTS = [
+    "Hola, ¿cómo estás? Espero que tengas un buen día.",
+    "El tren sale a las 8:30 desde el andén número 3.",
+    "Gracias por su paciencia, en un momento lo atendemos.",
+]
+
+
+def spectral_envelope(audio, n_fft=1024):
+    """Average log-magnitude spectrum, comparable between clips of different length"""
+    audio = audio.reshape(-1).float()
+    spectrum = torch.stft(audio, n_fft, hop_length=n_fft // 4, window=torch.hann_window(n_fft), return_complex=True)
+    return torch.log(spectrum.abs() + 1e-5).mean(dim=-1)
+
+
+def render_all(precision, texts, voice, preset, seed, device, output_dir):
+    """Render every text with a fresh engine; returns per-text results"""
+    engine = Engine(device=device, kv_cache=True, use_deepspeed=False, **precision_settings(precision))
+    # Loading includes quantizing (or reading the quantized cache)
+    start_time = time.time()
+    engine.conditioning_latents(voice)
+    load_seconds = time.time() - start_time
+
+    results = []
+    for i, text in enumerate(texts):
+        start_time = time.time()
+        audio = engine.synthesize(normalize_spanish_text(text), voice, preset=preset,
+                                  use_cache=False, use_deterministic_seed=seed)
+        render_seconds = time.time() - start_time
+        with IncrementalWavWriter(os.path.join(output_dir, f"{precision}_{i:02d}.wav"), SAMPLE_RATE) as writer:
+            writer.write(audio)
+        results.append({
+            'render_seconds': render_seconds,
+            'audio_seconds': audio.shape[-1] / SAMPLE_RATE,
+            'envelope': spectral_envelope(audio),
+        })
+    del engine
+    gc.collect()
+    return load_seconds, results
+
+
+def compare(texts, voice, preset='ultra_fast', precisions=('float32', 'int8'), seed=1234, device='cpu',
+            output_dir='precision_comparison'):
+    os.makedirs(output_dir, exist_ok=True)
+    report = {'preset': preset, 'device': device, 'threads': torch.get_num_threads(), 'precisions': {}}
+    reference = None
+    for precision in precisions:
+        print(f"\nRendering {len(texts)} texts at {precision}...")
+        load_seconds, results = render_all(precision, texts, voice, preset, seed, device, output_dir)
+        if reference is None:
+            reference = results
+        render_seconds = sum(result['render_seconds'] for result in results)
+        audio_seconds = sum(result['audio_seconds'] for result in results)
+        report['precisions'][precision] = {
+            'load_seconds': load_seconds,
+            'render_seconds': render_seconds,
+            'audio_seconds': audio_seconds,
+            'real_time_factor': render_seconds / audio_seconds if audio_seconds else None,
+            # Sampling diverges as soon as one token differs, so the outputs are
+            # compared by length and spectral envelope rather than sample by sample
+            'duration_ratio_vs_reference': audio_seconds / sum(result['audio_seconds'] for result in reference),
+            'spectral_distance_vs_reference': sum(
+                (result['envelope'] - ref['envelope']).abs().mean().item()
+                for result, ref in zip(results, reference)
+            ) / len(results),
+        }
+    first = report['precisions'][precisions[0]]['render_seconds']
+    for precision in precisions:
+        stats = report['precisions'][precision]
+        stats['speedup_vs_reference'] = first / stats['render_seconds'] if stats['render_seconds'] else None
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare speed and output of float32, half and int8 inference.')
+    parser.add_argument('--voice', default='tortoise/voices/juan', help='Voice name or directory.')
+    parser.add_argument('--preset', default='ultra_fast', help='Preset to render with.')
+    parser.add_argument('--precisions', default='float32,int8',
+                        help=f'Comma-separated precisions, the first is the reference ({", ".join(PRECISIONS)}).')
+    parser.add_argument('--seed', type=int, default=1234, help='Seed used for every precision.')
+    parser.add_argument('--device', default='cpu', help='Device for inference.')
+    parser.add_argument('--output-dir', default='precision_comparison', help='Where to write the rendered audio.')
+    parser.add_argument('texts', nargs='*', help='Texts to render.')
+    args = parser.parse_args()
+
+    report = compare(args.texts or DEFAULT_TEXTS, args.voice, args.preset, args.precisions.split(','),
+                     args.seed, args.device, args.output_dir)
+    print(json.dumps(report, indent=2))
@@ -4,71 +4,226 @@
 # pip install pydub
 
 import os
+import json
 from pathlib import Path
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def convert_m4a_to_wav():
+SAMPLE_RATE = 22050
+
+# Records which source each output came from, so unchanged files are skipped
+MANIFEST_NAME = '.conversions.json'
+
+def load_manifest(target_dir):
+    manifest_path = target_dir / MANIFEST_NAME
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {}
+
+def save_manifest(target_dir, manifest):
+    manifest_path = target_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def source_fingerprint(source_file):
+    stat = source_file.stat()
+    return {
+        'source': source_file.name,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+def is_up_to_date(output_file, fingerprint, manifest):
+    """An output is current if it exists and was produced from this exact source file"""
+    return output_file.exists() and manifest.get(output_file.name) == fingerprint
+
+class InProcessDecoder:
+    """
+    Decodes and resamples audio inside this process with torchaudio
+    Avoids spawning ffmpeg per file; one resampler is built per source sample
+    rate and shared by every file (and worker thread) with that rate.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        import torchaudio
+
+        self.torchaudio = torchaudio
+        self.sample_rate = sample_rate
+        self._resamplers = {}
+        self._lock = threading.Lock()
+
+    def resampler(self, orig_freq):
+        with self._lock:
+            if orig_freq not in self._resamplers:
+                self._resamplers[orig_freq] = self.torchaudio.transforms.Resample(orig_freq, self.sample_rate)
+            return self._resamplers[orig_freq]
+
+    def convert(self, source_file, output_file):
+        """Decode source_file and write it as mono 16-bit WAV at the target rate"""
+        waveform, orig_freq = self.torchaudio.load(str(source_file))
+        waveform = waveform.mean(dim=0, keepdim=True)
+        if orig_freq != self.sample_rate:
+            waveform = self.resampler(orig_freq)(waveform)
+        self.torchaudio.save(str(output_file), waveform, self.sample_rate,
+                             encoding='PCM_S', bits_per_sample=16)
+
+def convert_file(m4a_file, output_file, decoder=None):
+    """
+    Convert a single file, in-process when a decoder is given
+    Falls back to an ffmpeg subprocess for anything the decoder can't read.
+    :return: (success, error message)
+    """
+    if decoder is not None:
+        try:
+            decoder.convert(m4a_file, output_file)
+            return True, None
+        except Exception as e:
+            print(f"In-process decode failed for {m4a_file.name} ({type(e).__name__}), falling back to ffmpeg")
+
+    # Construct ffmpeg command
+    # -y: overwrite output file
+    # -i: input file
+    # -ac 1: convert to mono
+    # -ar 22050: set sample rate to 22050 Hz
+    cmd = [
+        './ffmpeg',
+        '-y',
+        '-i', str(m4a_file.absolute()),
+        '-ac', '1',
+        '-ar', str(SAMPLE_RATE),
+        str(output_file.absolute())
+    ]
+
+    # Run ffmpeg
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except Exception as e:
+        return False, f"{type(e).__name__}: {str(e)}"
+
+    if result.returncode == 0:
+        return True, None
+    return False, result.stderr
+
+def convert_m4a_to_wav(source_dir='voice_juan', target_dir='tortoise/voices/juan', workers=None, force=False,
+                       backend='ffmpeg'):
+    """
+    Convert every .m4a recording to mono 22050 Hz WAV in parallel
+    Outputs an earlier run made from recordings that are no longer there are removed.
+    :param source_dir: Directory with the .m4a recordings
+    :param target_dir: Voice directory to write the WAV files to
+    :param workers: Number of concurrent ffmpeg processes (defaults to the core count)
+    :param force: Convert every file even if its output is up to date
+    :param backend: 'ffmpeg' (one subprocess per file) or 'inprocess' (torchaudio,
+                    with ffmpeg as fallback for unsupported formats)
+    :return: Dict of output file name -> 'converted', 'skipped' or 'failed'
+    """
+    results = {}
     try:
         # Define source and target directories
-        source_dir = Path('voice_juan')
-        target_dir = Path('tortoise/voices/juan')
-        
+        source_dir = Path(source_dir)
+        target_dir = Path(target_dir)
+
         print(f"Looking for .m4a files in: {source_dir.absolute()}")
-        
+
         # Create target directory if it doesn't exist
         target_dir.mkdir(parents=True, exist_ok=True)
         print(f"Target directory created/verified: {target_dir.absolute()}")
-        
+
         # Check if source directory exists
         if not source_dir.exists():
             print(f"Error: Source directory '{source_dir.absolute()}' not found!")
-            return
-        
-        # List all m4a files
-        m4a_files = list(source_dir.glob('*.m4a'))
+            return results
+
+        # List all m4a files; sorted so each output keeps the same source between runs
+        m4a_files = sorted(source_dir.glob('*.m4a'))
         print(f"Found {len(m4a_files)} .m4a files")
-        
-        # Process all m4a files
+
+        previous = load_manifest(target_dir)
+        manifest = {} if force else dict(previous)
+        pending = {}
         for idx, m4a_file in enumerate(m4a_files):
+            output_file = target_dir / f'juan_{idx}.wav'
+            fingerprint = source_fingerprint(m4a_file)
+            if is_up_to_date(output_file, fingerprint, manifest):
+                results[output_file.name] = 'skipped'
+                continue
+            manifest.pop(output_file.name, None)
+            pending[output_file] = (m4a_file, fingerprint)
+
+        # Outputs an earlier run made from recordings that are gone would
+        # otherwise stay in the voice directory and be used as samples
+        outputs = {f'juan_{idx}.wav' for idx in range(len(m4a_files))}
+        for name in sorted(set(previous) - outputs):
+            stale_file = target_dir / name
+            if stale_file.exists():
+                stale_file.unlink()
+                print(f"Removed {name}, its recording is no longer in {source_dir}")
+            manifest.pop(name, None)
+
+        skipped = len(results)
+        if skipped:
+            print(f"Skipping {skipped} file(s) that are already up to date")
+
+        decoder = None
+        if backend == 'inprocess':
             try:
-                # Generate output filename
-                output_file = target_dir / f'juan_{idx}.wav'
-                
-                print(f"\nProcessing {m4a_file.name} -> {output_file.name}")
-                
-                # Construct ffmpeg command
-                # -y: overwrite output file
-                # -i: input file
-                # -ac 1: convert to mono
-                # -ar 22050: set sample rate to 22050 Hz
-                cmd = [
-                    './ffmpeg',
-                    '-y',
-                    '-i', str(m4a_file.absolute()),
-                    '-ac', '1',
-                    '-ar', '22050',
-                    str(output_file.absolute())
-                ]
-                
-                # Run ffmpeg
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    print(f"Successfully converted {m4a_file.name} to {output_file.name}")
-                else:
-                    print(f"Error converting {m4a_file.name}:")
-                    print(result.stderr)
-                
-            except Exception as e:
-                print(f"Error processing {m4a_file.name}:")
-                print(f"Error type: {type(e).__name__}")
-                print(f"Error message: {str(e)}")
-                print("Traceback:")
-                import traceback
-                traceback.print_exc()
-        
-        print(f"\nConversion complete! {len(m4a_files)} files processed.")
-        
+                decoder = InProcessDecoder()
+            except ImportError:
+                print("torchaudio is not installed, using ffmpeg for every file")
+        elif backend != 'ffmpeg':
+            raise ValueError(f"Unknown backend '{backend}'")
+
+        workers = workers or os.cpu_count() or 1
+        if pending:
+            print(f"Converting {len(pending)} file(s) with {min(workers, len(pending))} worker(s)...")
+
+        # In-process decodes share torch's intra-op thread pool; split it
+        # between the workers rather than running workers x threads at once
+        torch_threads = None
+        if decoder is not None and min(workers, len(pending)) > 1:
+            import torch
+
+            torch_threads = torch.get_num_threads()
+            torch.set_num_threads(max(1, torch_threads // min(workers, len(pending))))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(convert_file, m4a_file, output_file, decoder): output_file
+                    for output_file, (m4a_file, _) in pending.items()
+                }
+                for future in as_completed(futures):
+                    output_file = futures[future]
+                    m4a_file, fingerprint = pending[output_file]
+                    success, error = future.result()
+                    if success:
+                        manifest[output_file.name] = fingerprint
+                        # Saved per file so an interrupted run keeps what it finished
+                        save_manifest(target_dir, manifest)
+                        results[output_file.name] = 'converted'
+                        print(f"Successfully converted {m4a_file.name} to {output_file.name}")
+                    else:
+                        results[output_file.name] = 'failed'
+                        print(f"Error converting {m4a_file.name}:")
+                        print(error)
+        finally:
+            if torch_threads is not None:
+                torch.set_num_threads(torch_threads)
+
+        # Also drops entries of outputs that were about to be rewritten and failed
+        save_manifest(target_dir, manifest)
+
+        converted = sum(1 for status in results.values() if status == 'converted')
+        failed = sum(1 for status in results.values() if status == 'failed')
+        print(f"\nConversion complete! {len(m4a_files)} files processed: "
+              f"{converted} converted, {skipped} skipped, {failed} failed.")
+
     except Exception as e:
         print("An unexpected error occurred:")
         print(f"Error type: {type(e).__name__}")
@@ -77,5 +232,18 @@ def convert_m4a_to_wav():
         import traceback
         traceback.print_exc()
 
+    return results
+
 if __name__ == '__main__':
-    convert_m4a_to_wav() 
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert .m4a voice recordings to mono 22050 Hz WAV.')
+    parser.add_argument('--source-dir', default='voice_juan', help='Directory with the .m4a recordings.')
+    parser.add_argument('--target-dir', default='tortoise/voices/juan', help='Voice directory to write WAV files to.')
+    parser.add_argument('--workers', type=int, default=None, help='Parallel conversions (defaults to the core count).')
+    parser.add_argument('--force', action='store_true', help='Convert every file, even if it is up to date.')
+    parser.add_argument('--backend', choices=['ffmpeg', 'inprocess'], default='ffmpeg',
+                        help='Decode with an ffmpeg subprocess per file, or in-process with torchaudio.')
+    args = parser.parse_args()
+
+    convert_m4a_to_wav(args.source_dir, args.target_dir, args.workers, args.force, args.backend)
@@ -1,19 +1,36 @@
-from tortoise.api import TextToSpeech
-from tortoise.utils.audio import load_audio
-import torchaudio
 import os
+import shutil
 import time
+from collections import Counter
+
 import torch
 
-def generate_voice(text, preset='ultra_fast', output_filename=None, chunk_size=100):
+from audio_output import EXTENSIONS, EncodingPipeline, convert_output
+from parallel_render import render_parallel
+from render_manifest import DONE, FAILED, RenderManifest, load_chunk_audio, save_chunk_audio
+from runtime_config import get_runtime_plan
+from spanish_text import deduplicate_chunks, normalize_spanish_text, split_spanish_text
+from tts_engine import get_engine
+
+VOICE_DIR = "tortoise/voices/juan"
+
+ENGINE_SETTINGS = {
+    'kv_cache': True,         # Enable KV caching for memory efficiency
+    'use_deepspeed': False,   # Disable deepspeed
+}
+
+def engine_settings(precision=None):
     """
-    Generate voice with different quality presets - Optimized for lower-end hardware
-    
-    presets:
-    - ultra_fast: Fastest, lower quality (recommended)
-    - fast: Good balance
-    - standard: Better quality
-    - high_quality: Best quality, slowest
+    ENGINE_SETTINGS plus device, precision and batch size from the runtime plan
+    :param precision: 'half', 'float32' or 'int8'; detected for the hardware if None
+    """
+    return dict(ENGINE_SETTINGS, **get_runtime_plan(precision=precision).engine_settings())
+
+def load_engine(warm=True, precision=None):
+    """
+    Shared engine with the voice's conditioning latents ready
+    :param warm: Load the models now; parallel rendering loads them itself before forking its workers
+    :param precision: 'half', 'float32' or 'int8'; detected for the hardware if None
     """
     print("\nInitializing Text-to-Speech with optimized settings...")
     
@@ -21,99 +38,262 @@ def generate_voice(text, preset='ultra_fast', output_filename=None, chunk_size=1
     if torch.cuda.is_available():
         torch.cuda.empty_cache()
     
-    # Initialize TTS with optimized settings
-    tts = TextToSpeech(
-        kv_cache=True,    # Enable KV caching for memory efficiency
-        half=True,        # Use half precision
-        use_deepspeed=False,  # Disable deepspeed
-        device="cpu"      # Force CPU usage
-    )
-    
-    # Load voice samples with memory optimization
-    print("Loading voice samples...")
-    voice_samples = []
-    voice_dir = "tortoise/voices/juan"
-    for file in sorted(os.listdir(voice_dir)):
-        if file.endswith('.wav'):
-            try:
-                audio = load_audio(os.path.join(voice_dir, file), 22050)
-                voice_samples.append(audio)
-                # Clear memory after each load
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-            except Exception as e:
-                print(f"Warning: Could not load {file}: {str(e)}")
+    # Models are loaded once per process and shared by every entry point
+    engine = get_engine(**engine_settings(precision))
     
-    # Generate default output filename if none provided
-    if output_filename is None:
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        output_filename = f"output_{preset}_{timestamp}.wav"
-    elif not output_filename.endswith('.wav'):
-        output_filename += '.wav'
-    
-    # Split text into chunks if it's too long
-    words = text.split()
-    chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    for word in words:
-        if current_length + len(word) + 1 <= chunk_size:
-            current_chunk.append(word)
-            current_length += len(word) + 1
-        else:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-            current_length = len(word)
-    
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+    # Conditioning latents are computed once per voice and cached on disk,
+    # so the samples are only decoded when they changed
+    if warm:
+        print("Loading voice samples...")
+        engine.conditioning_latents(VOICE_DIR)
+    return engine
+
+def split_text(text, chunk_size=100):
+    """Split text into balanced chunks of at most chunk_size characters on sentence and clause boundaries"""
+    chunks = split_spanish_text(text, desired_length=chunk_size, max_length=chunk_size)
     
     # If text is short enough, process as single chunk
     if not chunks:
         chunks = [text]
+    return chunks
+
+def _render_unique(engine, chunks, preset, batch_size, memory_budget_mb, manifest=None, chunks_dir=None, workers=1,
+                   precision=None):
+    """
+    Yield (index, waveform) for each chunk, in order, as soon as it is ready
+    With a manifest, chunks already rendered with the same text and settings
+    are loaded from chunks_dir, and every outcome is recorded. Failed chunks
+    are reported and skipped.
+    """
+    keys = [None] * len(chunks)
+    done = {}
+    if manifest is not None:
+        os.makedirs(chunks_dir, exist_ok=True)
+        settings = engine.resolve_settings(VOICE_DIR, preset, {'k': 1})
+        for i, chunk in enumerate(chunks):
+            keys[i] = engine.cache_key(chunk, VOICE_DIR, preset, settings)
+            paths = manifest.completed(f"{i:04d}", chunk, keys[i])
+            if paths:
+                done[i] = paths[0]
+        if done:
+            print(f"Resuming: {len(done)} of {len(chunks)} chunks already rendered")
     
-    # Process each chunk
-    all_audio = []
-    total_start_time = time.time()
+    def finished(i, gen):
+        if manifest is not None:
+            path = os.path.join(chunks_dir, f"{i:04d}.npy")
+            save_chunk_audio(path, gen)
+            manifest.record(f"{i:04d}", chunks[i], keys[i], DONE, [path], params={'preset': preset})
+    
+    def failed(i, e):
+        if manifest is not None:
+            manifest.record(f"{i:04d}", chunks[i], keys[i], FAILED, error=str(e), params={'preset': preset})
+    
+    todo = [i for i in range(len(chunks)) if i not in done]
+    if workers > 1:
+        # Chunks are spread over worker processes and come back in order
+        rendered = render_parallel([chunks[i] for i in todo], VOICE_DIR, preset, workers, engine_settings(precision))
+        for i in range(len(chunks)):
+            if i in done:
+                yield i, load_chunk_audio(done[i])
+                continue
+            _, gen, error = next(rendered)
+            if error is not None:
+                print(f"Error processing chunk {i + 1}: {str(error)}")
+                failed(i, error)
+                continue
+            finished(i, gen)
+            yield i, gen
+        return
+    
+    if batch_size > 1:
+        # Several chunks go through the model together
+        print(f"\nProcessing {len(todo)} chunks in batches of up to {batch_size}...")
+        results = {}
+        try:
+            gens = engine.synthesize_batch(
+                [chunks[i] for i in todo], VOICE_DIR,
+                preset=preset,
+                batch_size=batch_size,
+                memory_budget_mb=memory_budget_mb,
+                return_exceptions=True
+            )
+            for i, gen in zip(todo, gens):
+                if isinstance(gen, Exception):
+                    print(f"Error processing chunk {i + 1}: {str(gen)}")
+                    failed(i, gen)
+                    continue
+                finished(i, gen)
+                results[i] = gen
+        except Exception as e:
+            print(f"Error processing batch: {str(e)}")
+            for i in todo:
+                if i not in results:
+                    failed(i, e)
+        for i in range(len(chunks)):
+            if i in done:
+                yield i, load_chunk_audio(done[i])
+            elif i in results:
+                yield i, results.pop(i)
+        return
     
-    for i, chunk in enumerate(chunks, 1):
-        print(f"\nProcessing chunk {i}/{len(chunks)}:")
+    for i, chunk in enumerate(chunks):
+        if i in done:
+            yield i, load_chunk_audio(done[i])
+            continue
+        
+        print(f"\nProcessing chunk {i + 1}/{len(chunks)}:")
         print(f"Text: '{chunk}'")
         chunk_start_time = time.time()
         
         try:
-            gen = tts.tts_with_preset(
-                chunk,
-                voice_samples=voice_samples,
-                preset=preset,
-                k=1
-            )
-            all_audio.append(gen.squeeze(0).cpu())
-            
-            chunk_duration = time.time() - chunk_start_time
-            print(f"Chunk completed in {chunk_duration:.1f} seconds")
-            
-            # Clear memory after each chunk
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            
+            gen = engine.synthesize(chunk, VOICE_DIR, preset=preset, k=1)
         except Exception as e:
             print(f"Error processing chunk: {str(e)}")
+            failed(i, e)
             continue
-    
-    # Combine all audio chunks and save
-    if all_audio:
-        final_audio = torch.cat(all_audio, dim=1)
-        torchaudio.save(output_filename, final_audio, 24000)
+        finished(i, gen)
+        
+        chunk_duration = time.time() - chunk_start_time
+        print(f"Chunk completed in {chunk_duration:.1f} seconds")
+        
+        # Clear memory after each chunk
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
         
+        yield i, gen
+
+def render_chunks(engine, chunks, preset='ultra_fast', batch_size=1, memory_budget_mb=None,
+                  manifest=None, chunks_dir=None, workers=1, precision=None):
+    """
+    Yield each chunk's 24 kHz waveform as soon as it is ready
+    Repeated chunks are rendered once; their waveform is kept until its last
+    occurrence. Failed chunks are reported and skipped.
+    :param manifest: RenderManifest to resume from and record progress in
+    :param chunks_dir: Where rendered chunks are kept while the manifest is in use
+    :param workers: Render on this many processes, each on its own slice of the CPU cores
+    :param precision: Model precision of the worker processes
+    """
+    unique, order = deduplicate_chunks(chunks)
+    remaining = Counter(order)
+    rendered = {}
+    waveforms = _render_unique(engine, unique, preset, batch_size, memory_budget_mb, manifest, chunks_dir, workers,
+                               precision)
+    for idx in order:
+        # Unique chunks come out in order of first appearance, so the next
+        # new chunk is always the next one the renderer produces
+        if idx not in rendered:
+            for done_idx, gen in waveforms:
+                rendered[done_idx] = gen
+                if done_idx >= idx:
+                    break
+        gen = rendered.get(idx)
+        remaining[idx] -= 1
+        if not remaining[idx]:
+            rendered.pop(idx, None)
+        if gen is not None:
+            yield gen
+
+def stream_voice(text, preset='ultra_fast', chunk_size=100):
+    """
+    Generator version of generate_voice
+    Yields each chunk's 24 kHz waveform (shape (1, samples)) as soon as it has
+    been rendered, so playback can start after the first chunk.
+    """
+    engine = load_engine()
+    yield from render_chunks(engine, split_text(normalize_spanish_text(text), chunk_size), preset)
+
+def synthesize_audio(text, preset='ultra_fast', output='tensor', chunk_size=100, batch_size=1, precision=None):
+    """
+    Render text entirely in memory
+    :param output: 'tensor' or 'numpy' (float32, shape (1, samples)), 'pcm'
+                   (memoryview of 16-bit PCM), or encoded bytes: 'wav', 'flac',
+                   'opus' or 'mp3'
+    :return: 24 kHz audio in the requested form, or None if nothing was rendered
+    """
+    engine = load_engine(precision=precision)
+    chunks = split_text(normalize_spanish_text(text), chunk_size)
+    audio = list(render_chunks(engine, chunks, preset, batch_size))
+    if not audio:
+        return None
+    return convert_output(torch.cat(audio, dim=-1), output)
+
+def generate_voice(text, preset='ultra_fast', output_filename=None, chunk_size=100,
+                   batch_size=1, memory_budget_mb=None, workers=1, precision=None,
+                   output_format=None, bitrate=None, sample_rate=None):
+    """
+    Generate voice with different quality presets - Optimized for lower-end hardware
+    
+    presets:
+    - ultra_fast: Fastest, lower quality (recommended)
+    - fast: Good balance
+    - standard: Better quality
+    - high_quality: Best quality, slowest
+    
+    batch_size > 1 renders that many chunks per model pass; memory_budget_mb
+    caps the estimated memory of a batch. workers > 1 renders chunks on that
+    many processes instead, splitting the CPU cores between them; where fork is
+    available the workers share one copy of the model weights.
+    
+    The device, precision and thread counts come from runtime_config, which
+    picks what is fast on this machine; precision overrides its choice. On CPU,
+    precision='int8' is faster but changes the output (see compare_precision.py).
+    
+    Chunks are encoded on a background thread as they finish, overlapping with
+    the synthesis of the next chunk, so the full waveform is never held in
+    memory. The format follows the file extension (.wav, .flac, .opus/.ogg,
+    .mp3, .pcm) unless output_format is given; bitrate (e.g. '32k') applies to
+    the compressed formats and sample_rate resamples the 24 kHz output.
+    
+    Progress is recorded in <output>.manifest.json. Running again with the same
+    output filename resumes an interrupted job and retries failed chunks; the
+    manifest and the rendered chunks are removed once every chunk succeeded.
+    """
+    engine = load_engine(warm=workers <= 1, precision=precision)
+    
+    # Generate default output filename if none provided
+    if output_filename is None:
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        output_filename = f"output_{preset}_{timestamp}.{output_format or 'wav'}"
+    elif os.path.splitext(output_filename)[1].lower() not in EXTENSIONS:
+        output_filename += f".{output_format or 'wav'}"
+    
+    chunks = split_text(normalize_spanish_text(text), chunk_size)
+    unique, _ = deduplicate_chunks(chunks)
+    total_start_time = time.time()
+    
+    base_name = os.path.splitext(output_filename)[0]
+    manifest = RenderManifest(f"{base_name}.manifest.json")
+    chunks_dir = f"{base_name}_chunks"
+    
+    with EncodingPipeline(output_filename, output_format, 24000, bitrate, sample_rate) as writer:
+        for gen in render_chunks(engine, chunks, preset, batch_size, memory_budget_mb, manifest, chunks_dir, workers,
+                                 precision):
+            writer.write(gen)
+            if writer.frames_written == gen.shape[-1]:
+                print(f"First audio available after {time.time() - total_start_time:.1f} seconds")
+    
+    if writer.frames_written:
         total_duration = time.time() - total_start_time
         print(f"\nTotal generation completed in {total_duration:.1f} seconds")
+        if len(unique) < len(chunks):
+            rendered_chars = sum(len(chunk) for chunk in unique)
+            repeated_chars = sum(len(chunk) for chunk in chunks) - rendered_chars
+            print(f"Reused {len(chunks) - len(unique)} repeated chunks ({repeated_chars} characters), "
+                  f"saving about {total_duration * repeated_chars / rendered_chars:.1f} seconds of synthesis")
         print(f"Saved to: {output_filename}")
-        return output_filename
     else:
+        writer.discard()
         print("No audio was generated successfully")
-        return None
+    
+    failed = manifest.statuses({f"{i:04d}" for i in range(len(unique))}).get(FAILED, 0)
+    if failed:
+        print(f"{failed} chunk(s) failed and are missing from the output; "
+              f"run again with output filename '{output_filename}' to retry them")
+    else:
+        if os.path.exists(manifest.path):
+            os.remove(manifest.path)
+        shutil.rmtree(chunks_dir, ignore_errors=True)
+    return output_filename if writer.frames_written else None
 
 if __name__ == "__main__":
     # Available presets
@@ -156,7 +336,7 @@ if __name__ == "__main__":
             print("Please enter a valid number")
     
     # Get output filename (optional)
-    output_file = input("\nEnter output filename (optional, press Enter for automatic name): ").strip()
+    output_file = input("\nEnter output filename, .wav/.flac/.opus/.mp3 (optional, press Enter for automatic name): ").strip()
     
     # Get chunk size (optional)
     chunk_size = 100  # default
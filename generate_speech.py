@@ -1,10 +1,12 @@
 import torch
 import torchaudio
 import numpy as np
-from tortoise.api import TextToSpeech
-from tortoise.utils.audio import load_audio, load_voice, load_voices
 import os
 
+from runtime_config import get_runtime_plan
+from spanish_text import normalize_spanish_text
+from tts_engine import get_engine, list_voice_samples
+
 def generate_speech(text, voice_samples=None, voice_dir=None, output_path=None):
     """
     Generate speech using Tortoise TTS
@@ -13,43 +15,30 @@ def generate_speech(text, voice_samples=None, voice_dir=None, output_path=None):
     :param voice_dir: Directory containing voice samples
     :param output_path: Path to save the generated audio
     """
-    # Initialize Tortoise TTS
-    print("Initializing Tortoise TTS...")
-    tts = TextToSpeech()
+    # Models are loaded once per process and reused across calls, with the
+    # device and precision that suit this machine
+    engine = get_engine(**get_runtime_plan().engine_settings())
     
-    # Load voice samples
     if voice_dir and os.path.exists(voice_dir):
         print(f"Loading voice samples from {voice_dir}")
-        # Load all wav files from the directory
-        voice_samples = []
-        for file in sorted(os.listdir(voice_dir)):
-            if file.endswith('.wav'):
-                file_path = os.path.join(voice_dir, file)
-                print(f"Loading {file}")
-                audio = load_audio(file_path, 22050)
-                voice_samples.append(audio)
-        
-        if not voice_samples:
+        if not list_voice_samples(voice_dir):
             raise ValueError(f"No WAV files found in {voice_dir}")
+        voice = voice_dir
     elif voice_samples:
         print("Using provided voice samples")
-        voice_samples = [load_audio(p, 22050) for p in voice_samples]
+        voice = list(voice_samples)
     else:
         raise ValueError("Either voice_dir or voice_samples must be provided")
     
     # Generate speech
+    text = normalize_spanish_text(text)
     print(f"Generating speech for text: '{text}'")
-    gen = tts.tts_with_preset(
-        text,
-        voice_samples=voice_samples,
-        preset='fast',
-        k=1
-    )
+    gen = engine.synthesize(text, voice, preset='fast', k=1)
     
     # Save the generated audio
     if output_path:
         print(f"Saving audio to {output_path}")
-        torchaudio.save(output_path, gen.squeeze(0).cpu(), 24000)
+        torchaudio.save(output_path, gen, 24000)
     
     print("Speech generation complete!")
     return gen
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+
+import torch
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "conditioning_latents.pth")
+# Where tortoise looks for its checkpoints when no models_dir is given
+DEFAULT_MODELS_DIR = os.environ.get(
+    'TORTOISE_MODELS_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'tortoise', 'models'))
+# Checkpoints whose weights shape the latents or the audio rendered from them
+MODEL_CHECKPOINTS = ('autoregressive.pth', 'diffusion_decoder.pth', 'clvp2.pth', 'vocoder.pth')
+
+# In-process copies of latents and sample digests, so repeated calls in the
+# same process don't even touch the disk
+_latents_memo = {}
+_digest_memo = {}
+
+
+def load_voice_settings(voice_dir):
+    """Return the 'settings' block of a voice's metadata.json (empty if there is none)"""
+    metadata_path = os.path.join(voice_dir, "metadata.json")
+    if not os.path.exists(metadata_path):
+        return {}
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("settings", {})
+
+
+def resolve_cache_path(voice_dir, settings=None):
+    """
+    Work out where a voice's conditioning latents live
+    :param voice_dir: Directory of the voice
+    :param settings: Voice settings (read from metadata.json if omitted)
+    :return: (cache_path, use_cache)
+    """
+    if settings is None:
+        settings = load_voice_settings(voice_dir)
+    use_cache = settings.get("use_cache", True)
+    cache_path = settings.get("conditioning_latents_cache_path", DEFAULT_CACHE_PATH)
+    if not os.path.isabs(cache_path):
+        cache_path = os.path.join(voice_dir, cache_path)
+    return cache_path, use_cache
+
+
+def get_model_version(models_dir=None):
+    """
+    Identify the models the latents were computed with
+    Includes the digest of every checkpoint that exists, so a checkpoint
+    replaced in place (a fine-tuned model) invalidates the latents and the
+    audio cached with them.
+    """
+    try:
+        from importlib.metadata import version
+        tortoise_version = version("tortoise-tts")
+    except Exception:
+        tortoise_version = "unknown"
+    models_dir = models_dir or ""
+    checkpoints = []
+    for name in MODEL_CHECKPOINTS:
+        path = os.path.join(models_dir or DEFAULT_MODELS_DIR, name)
+        if os.path.exists(path):
+            checkpoints.append(f"{name}={file_digest(path)}")
+    return (f"tortoise-tts=={tortoise_version};models_dir={os.path.abspath(models_dir) if models_dir else ''};"
+            f"{','.join(checkpoints)}")
+
+
+def file_digest(path):
+    """SHA-256 of a file, memoized on (mtime, size) so unchanged files are hashed once"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    digest = _digest_memo.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def compute_cache_key(sample_paths, model_version):
+    """Key latents on the content of every sample file plus the model version"""
+    h = hashlib.sha256(model_version.encode('utf-8'))
+    for path in sorted(sample_paths, key=os.path.basename):
+        h.update(os.path.basename(path).encode('utf-8'))
+        h.update(file_digest(path).encode('ascii'))
+    return h.hexdigest()
+
+
+def _to_device(latents, device):
+    return tuple(latent.to(device) for latent in latents)
+
+
+def get_conditioning_latents(tts, sample_paths, voice_samples=None, cache_path=None, use_cache=True, store_dir=None):
+    """
+    Return the (autoregressive, diffusion) conditioning latents for a voice, computing them at most once
+    :param tts: TextToSpeech instance used to compute the latents
+    :param sample_paths: Paths of the WAV files the voice is made of
+    :param voice_samples: Already loaded samples; loaded from sample_paths only on a cache miss if omitted
+    :param cache_path: File to persist the latents to, or None to keep them in memory only
+    :param use_cache: Set to False to always recompute
+    :param store_dir: Voice store to load samples through on a miss (see voice_store)
+    """
+    if not sample_paths:
+        raise ValueError("No voice samples provided")
+
+    device = getattr(tts, "device", "cpu")
+    key = compute_cache_key(sample_paths, get_model_version(getattr(tts, "models_dir", None)))
+
+    if use_cache:
+        if key in _latents_memo:
+            return _to_device(_latents_memo[key], device)
+
+        if cache_path and os.path.exists(cache_path):
+            try:
+                cached = torch.load(cache_path, map_location="cpu")
+                if cached.get("key") == key:
+                    print(f"Using cached conditioning latents from {cache_path}")
+                    _latents_memo[key] = cached["latents"]
+                    return _to_device(cached["latents"], device)
+                print("Voice samples changed, recomputing conditioning latents...")
+            except Exception as e:
+                print(f"Warning: Could not read latents cache {cache_path}: {str(e)}")
+
+    if voice_samples is None:
+        from voice_store import load_samples
+
+        voice_samples = load_samples(sample_paths, store_dir)
+    if not voice_samples:
+        raise ValueError("No voice samples could be loaded")
+
+    print("Computing conditioning latents...")
+    latents = tts.get_conditioning_latents(voice_samples)
+    latents = tuple(latent.detach().cpu() for latent in latents)
+
+    if use_cache:
+        _latents_memo[key] = latents
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            torch.save({"key": key, "model_version": get_model_version(getattr(tts, "models_dir", None)), "latents": latents}, tmp_path)
+            os.replace(tmp_path, cache_path)
+            print(f"Saved conditioning latents to {cache_path}")
+
+    return _to_device(latents, device)
@@ -0,0 +1,120 @@
+import gc
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+
+_worker_engine = None
+
+
+def usable_cores():
+    """CPU cores this process may run on (its affinity mask, where the OS has one)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slices(workers, cores=None):
+    """
+    Split the usable CPU cores into one contiguous slice per worker
+    Slice sizes differ by at most one core, so every core is used. With more
+    workers than cores, the extra workers share cores round-robin.
+    """
+    if cores is None:
+        cores = usable_cores()
+    per_worker, extra = divmod(len(cores), workers)
+    slices = []
+    start = 0
+    for i in range(workers):
+        size = per_worker + (1 if i < extra else 0)
+        slices.append(cores[start:start + size] or [cores[i % len(cores)]])
+        start += size
+    return slices
+
+
+def can_share_weights():
+    """Forked workers can share the parent's weights; fork is not available on Windows"""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def _init_worker(slices, counter, tts_kwargs):
+    """
+    Pin the worker to its slice of cores and get its engine
+    A forked worker inherits the parent's loaded engine; a spawned one loads its own.
+    """
+    global _worker_engine
+    with counter.get_lock():
+        worker_idx = counter.value
+        counter.value += 1
+    cores = slices[worker_idx % len(slices)]
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+    from tts_engine import get_engine
+
+    _worker_engine = get_engine(**tts_kwargs)
+
+
+def _render_chunk(text, voice, preset, params):
+    gen = _worker_engine.synthesize(text, voice, preset=preset, **params)
+    # Arrays pickle back to the parent more cheaply than tensors
+    return gen.numpy()
+
+
+def render_parallel(texts, voice, preset='fast', workers=None, tts_kwargs=None, share_weights=True, **params):
+    """
+    Render chunks on a pool of worker processes
+    Each worker is pinned to its own slice of cores, with torch limited to that
+    many threads; workers pull chunks from the pool's shared queue.
+    With share_weights, the models are loaded once here and the workers are
+    forked from this process: the weight pages are shared copy-on-write, so
+    each worker only adds its activations. Otherwise every worker loads its
+    own copy.
+    :param texts: Chunks to speak
+    :param voice: Voice directory or voice name
+    :param preset: Preset name
+    :param workers: Number of processes (default: one per 4 cores)
+    :param tts_kwargs: Arguments for the workers' TextToSpeech
+    :param share_weights: Fork workers from a process holding the loaded models, where fork is available
+    :param params: Tuning overrides for Engine.synthesize
+    :return: Generator of (index, waveform, error) in chunk order; waveform is
+             None when the chunk failed
+    """
+    cores = usable_cores()
+    slices = core_slices(workers or max(1, len(cores) // 4), cores)
+    tts_kwargs = tts_kwargs or {}
+    params.setdefault('k', 1)
+
+    context = None
+    if share_weights and can_share_weights():
+        from tts_engine import get_engine
+
+        # Everything the workers need is loaded before the fork: the models
+        # and the voice's conditioning latents
+        engine = get_engine(**tts_kwargs)
+        engine.conditioning_latents(voice)
+        # Keep the garbage collector from writing to (and so copying) the
+        # pages of objects that already exist
+        gc.freeze()
+        context = multiprocessing.get_context('fork')
+    elif share_weights:
+        print("Fork is not available here, every worker loads its own copy of the models")
+
+    counter = (context or multiprocessing).Value('i', 0)
+    print(f"Rendering {len(texts)} chunks on {len(slices)} worker processes over {len(cores)} cores")
+    pool = ProcessPoolExecutor(max_workers=max(1, min(len(slices), len(texts))), mp_context=context,
+                               initializer=_init_worker, initargs=(slices, counter, tts_kwargs))
+    try:
+        futures = [pool.submit(_render_chunk, text, voice, preset, params) for text in texts]
+        for i, future in enumerate(futures):
+            try:
+                yield i, torch.from_numpy(future.result()), None
+            except Exception as e:
+                yield i, None, e
+    finally:
+        # Stop early if the caller stops reading
+        pool.shutdown(cancel_futures=True)
+        if context is not None:
+            gc.unfreeze()
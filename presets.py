@@ -0,0 +1,65 @@
+from latents_cache import load_voice_settings
+
+# Same values TextToSpeech.tts_with_preset uses
+TORTOISE_DEFAULTS = {
+    'temperature': .8,
+    'length_penalty': 1.0,
+    'repetition_penalty': 2.0,
+    'top_p': .8,
+    'cond_free_k': 2.0,
+    'diffusion_temperature': 1.0,
+    'cvvp_amount': .0,
+    'max_mel_tokens': 500,
+    'cond_free': True,
+}
+TORTOISE_PRESETS = {
+    'ultra_fast': {'num_autoregressive_samples': 16, 'diffusion_iterations': 30, 'cond_free': False},
+    'fast': {'num_autoregressive_samples': 96, 'diffusion_iterations': 80},
+    'standard': {'num_autoregressive_samples': 256, 'diffusion_iterations': 200},
+    'high_quality': {'num_autoregressive_samples': 256, 'diffusion_iterations': 400},
+}
+
+# Generation parameters that can be tuned per voice or per request
+# (the same list tortoise_tts.py exposes as tuning options)
+TUNING_OPTIONS = [
+    'num_autoregressive_samples', 'temperature', 'length_penalty', 'repetition_penalty', 'top_p',
+    'max_mel_tokens', 'cvvp_amount', 'diffusion_iterations', 'cond_free', 'cond_free_k', 'diffusion_temperature']
+
+
+def voice_presets(voice_dir):
+    """Presets declared in a voice's metadata.json (settings.presets)"""
+    if not voice_dir:
+        return {}
+    return load_voice_settings(voice_dir).get("presets", {})
+
+
+def tuning_overrides(args):
+    """Tuning options that were actually set on an argparse namespace"""
+    return {
+        option: getattr(args, option)
+        for option in TUNING_OPTIONS
+        if getattr(args, option, None) is not None
+    }
+
+
+def resolve_preset(preset, presets=None, overrides=None):
+    """
+    Merge everything that decides how an utterance is generated into one parameter set
+    Later layers win: Tortoise defaults, the Tortoise preset, the voice's own
+    preset from metadata.json, then per-request overrides.
+    :param preset: Preset name
+    :param presets: Voice presets (see voice_presets)
+    :param overrides: Per-request tuning options; None values are ignored
+    :return: Dict of keyword arguments for TextToSpeech.tts
+    """
+    presets = presets or {}
+    if preset not in TORTOISE_PRESETS and preset not in presets:
+        available = sorted(set(TORTOISE_PRESETS) | set(presets))
+        raise ValueError(f"Invalid preset '{preset}'. Available presets: " + ", ".join(available))
+
+    settings = dict(TORTOISE_DEFAULTS)
+    settings.update(TORTOISE_PRESETS.get(preset, {}))
+    settings.update(presets.get(preset, {}))
+    if overrides:
+        settings.update({name: value for name, value in overrides.items() if value is not None})
+    return settings
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+from latents_cache import file_digest, get_model_version
+
+QUANTIZED_DIR = os.path.join("cache", "quantized")
+# Checkpoint each quantized model is built from
+CHECKPOINTS = {
+    'autoregressive': 'autoregressive.pth',
+    'clvp': 'clvp2.pth',
+}
+
+# Generation precision -> TextToSpeech/Engine arguments
+PRECISIONS = {
+    'float32': {'half': False},
+    'half': {'half': True},
+    # fp16 is slow (or unsupported) on most CPUs; dynamic int8 runs the
+    # linear layers of the autoregressive model and CLVP with int8 kernels
+    'int8': {'half': False, 'quantize': True},
+}
+
+
+def precision_settings(precision):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {', '.join(PRECISIONS)}")
+    return dict(PRECISIONS[precision])
+
+
+def conv1d_to_linear(module):
+    """
+    Replace the GPT-2 style Conv1D layers of a module with nn.Linear
+    HuggingFace's GPT-2 implements its projections as Conv1D (a linear layer
+    with a transposed weight), which dynamic quantization does not recognise.
+    :return: Number of layers replaced
+    """
+    replaced = 0
+    for name, child in module.named_children():
+        if type(child).__name__ == 'Conv1D' and hasattr(child, 'nf'):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features, bias=child.bias is not None)
+            linear.weight.data = child.weight.data.t().contiguous()
+            if child.bias is not None:
+                linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+            replaced += 1
+        else:
+            replaced += conv1d_to_linear(child)
+    return replaced
+
+
+def quantize_module(module):
+    """Dynamically quantize every linear layer of a module to int8, in place"""
+    conv1d_to_linear(module)
+    return torch.ao.quantization.quantize_dynamic(module.float().eval(), {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def quantized_path(name, models_dir=None, cache_dir=QUANTIZED_DIR, kv_cache=False, use_deepspeed=False):
+    """
+    Cache file of a quantized model
+    Keyed on the content of its checkpoint (fine-tuned models are usually
+    replaced in place), the torch version, and the TextToSpeech flags that are
+    baked into the pickled module.
+    """
+    checkpoint = os.path.join(models_dir or "", CHECKPOINTS.get(name, f"{name}.pth"))
+    digest = file_digest(checkpoint) if os.path.exists(checkpoint) else "missing"
+    version = (f"{get_model_version(models_dir)};{name}={digest};torch=={torch.__version__};"
+               f"kv_cache={bool(kv_cache)};use_deepspeed={bool(use_deepspeed)}")
+    return os.path.join(cache_dir, f"{name}-{hashlib.sha256(version.encode('utf-8')).hexdigest()[:16]}.pt")
+
+
+def quantize_tts(tts, models_dir=None, cache_dir=QUANTIZED_DIR, kv_cache=False, use_deepspeed=False):
+    """
+    Swap the autoregressive model and CLVP of a loaded TextToSpeech for int8 versions
+    Quantized models are saved whole, so later runs load them from the cache
+    instead of converting again. Only used on CPU; CUDA keeps its own precision.
+    :param kv_cache: The kv_cache the TextToSpeech was built with
+    :param use_deepspeed: The use_deepspeed the TextToSpeech was built with
+    """
+    models_dir = models_dir or getattr(tts, 'models_dir', None)
+    if str(tts.device) != 'cpu':
+        print("int8 quantization only applies to CPU inference, keeping the original models")
+        return tts
+
+    for name in ('autoregressive', 'clvp'):
+        path = quantized_path(name, models_dir, cache_dir, kv_cache, use_deepspeed)
+        start_time = time.time()
+        if os.path.exists(path):
+            try:
+                setattr(tts, name, torch.load(path, map_location='cpu', weights_only=False))
+                print(f"Loaded int8 {name} model in {time.time() - start_time:.1f} seconds")
+                continue
+            except Exception as e:
+                print(f"Could not load {path} ({str(e)}), quantizing again")
+
+        model = quantize_module(getattr(tts, name))
+        setattr(tts, name, model)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, path)
+        print(f"Quantized {name} model to int8 in {time.time() - start_time:.1f} seconds")
+    return tts
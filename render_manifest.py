@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+# Chunk states recorded in the manifest
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def text_hash(text):
+    return hashlib.sha256(" ".join(text.split()).encode('utf-8')).hexdigest()
+
+
+class RenderManifest:
+    """
+    Per-chunk record of a long-form rendering job
+    Each chunk entry holds the hash of its text, the key of the settings it was
+    rendered with, its status and its output files. The manifest is rewritten
+    atomically after every change, so an interrupted job can be resumed by
+    skipping the chunks that are done and still match.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: JSON file; loaded if it exists
+        """
+        self.path = path
+        self.job = {}
+        self.chunks = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.job = data.get('job', {})
+                self.chunks = data.get('chunks', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {path}: {str(e)}")
+
+    def completed(self, name, text, key):
+        """
+        Output files of a chunk that was already rendered from this text with these settings
+        :param key: Identifies everything besides the text that changes the output
+        :return: List of paths, or None if the chunk has to be rendered
+        """
+        entry = self.chunks.get(name)
+        if (entry is None or entry['status'] != DONE or
+                entry['text_hash'] != text_hash(text) or entry['key'] != key):
+            return None
+        if not all(os.path.exists(path) for path in entry['paths']):
+            return None
+        return entry['paths']
+
+    def record(self, name, text, key, status, paths=(), error=None, params=None):
+        self.chunks[name] = {
+            'text_hash': text_hash(text),
+            'key': key,
+            'params': params or {},
+            'status': status,
+            'paths': list(paths),
+            'error': error,
+            'updated': time.time(),
+        }
+        self.save()
+
+    def statuses(self, names=None):
+        """Number of chunks in each state, optionally only among the given chunk names"""
+        counts = {}
+        for name, entry in self.chunks.items():
+            if names is None or name in names:
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'job': self.job, 'chunks': self.chunks}, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+
+def save_chunk_audio(path, audio):
+    """Store a rendered chunk as float32 .npy (written atomically)"""
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, audio.detach().cpu().numpy().astype(np.float32))
+    os.replace(tmp_path, path)
+
+
+def load_chunk_audio(path):
+    return torch.from_numpy(np.load(path))
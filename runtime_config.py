@@ -0,0 +1,139 @@
+import os
+
+import torch
+
+from batched_tts import estimate_batch_memory_mb
+from quantization import PRECISIONS, precision_settings
+
+AR_BATCH_SIZES = (16, 8, 4, 2, 1)
+# Share of free memory the autoregressive batch may take; the rest is left to
+# the models, diffusion and everything else on the machine
+AR_MEMORY_SHARE = 0.25
+
+
+def usable_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def device_type(device):
+    """'cuda' for 'cuda', 'cuda:0', ...; 'cpu', 'mps', ... otherwise"""
+    return torch.device(device).type
+
+
+def available_memory_mb(device):
+    """Free memory on the device in MB, or None if it can't be told"""
+    if device_type(device) == 'cuda':
+        free, _ = torch.cuda.mem_get_info()
+        return free / (1024 * 1024)
+    try:
+        import psutil
+
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES') / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_device():
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def default_precision(device):
+    """
+    Default precision for the device
+    GPUs with tensor cores run fp16 well; older GPUs stay in float32. CPUs use
+    float32: int8 is faster but changes the output, so it is only used when
+    asked for (precision='int8', see compare_precision.py).
+    """
+    if device_type(device) == 'cuda':
+        major, _ = torch.cuda.get_device_capability(device)
+        return 'half' if major >= 7 else 'float32'
+    return 'float32'
+
+
+def default_ar_batch_size(device, memory_mb, bytes_per_value=4):
+    """Largest autoregressive batch whose key/value cache fits in a share of free memory"""
+    if memory_mb is None:
+        return 4 if device == 'cpu' else None
+    for batch_size in AR_BATCH_SIZES:
+        if estimate_batch_memory_mb(1, 200, batch_size, 500, bytes_per_value) <= memory_mb * AR_MEMORY_SHARE:
+            return batch_size
+    return 1
+
+
+class RuntimePlan:
+    """
+    How inference runs on this machine: device, precision, torch threads and
+    the autoregressive batch size. Anything not given is detected.
+    """
+
+    def __init__(self, device=None, precision=None, threads=None, interop_threads=None, ar_batch_size=None):
+        self.device = device or default_device()
+        if device_type(self.device) == 'cuda' and not torch.cuda.is_available():
+            print("CUDA requested but not available, using the CPU")
+            self.device = 'cpu'
+        self.precision = precision or default_precision(self.device)
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{self.precision}', expected one of {', '.join(PRECISIONS)}")
+        if device_type(self.device) == 'cpu' and self.precision == 'half':
+            print("Half precision is slow or unsupported on CPU, using float32")
+            self.precision = 'float32'
+
+        self.cores = usable_cores()
+        # On CPU all cores go to the matrix multiplies; on GPU a few threads
+        # are enough to feed the device
+        self.threads = threads or (self.cores if device_type(self.device) == 'cpu' else min(self.cores, 4))
+        self.interop_threads = interop_threads or max(1, min(4, self.cores // 8))
+        self.memory_mb = available_memory_mb(self.device)
+        bytes_per_value = 2 if self.precision == 'half' else 4
+        self.ar_batch_size = ar_batch_size or default_ar_batch_size(device_type(self.device), self.memory_mb,
+                                                                    bytes_per_value)
+
+    def engine_settings(self):
+        """Arguments for get_engine/Engine"""
+        settings = {'device': self.device}
+        settings.update(precision_settings(self.precision))
+        if self.ar_batch_size:
+            settings['autoregressive_batch_size'] = self.ar_batch_size
+        return settings
+
+    def apply(self):
+        """Set torch's thread pools"""
+        torch.set_num_threads(self.threads)
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError:
+            # Can only be set before the first parallel operation
+            pass
+
+    def describe(self):
+        memory = f"{self.memory_mb / 1024:.1f} GB free" if self.memory_mb is not None else "memory unknown"
+        batch = self.ar_batch_size or "auto"
+        return (f"device={self.device}, precision={self.precision}, "
+                f"threads={self.threads} intra-op / {self.interop_threads} inter-op, "
+                f"autoregressive batch={batch} ({self.cores} cores, {memory})")
+
+
+_plan = None
+_plan_request = None
+
+
+def get_runtime_plan(device=None, precision=None, threads=None, ar_batch_size=None):
+    """
+    Process-wide runtime plan, applied and logged on first use
+    Calls without explicit settings reuse the current plan; different explicit
+    settings make a new one.
+    """
+    global _plan, _plan_request
+    request = (device, precision, threads, ar_batch_size)
+    if _plan is None or (any(value is not None for value in request) and request != _plan_request):
+        _plan = RuntimePlan(device, precision, threads, ar_batch_size=ar_batch_size)
+        _plan_request = request
+        _plan.apply()
+        print(f"Runtime plan: {_plan.describe()}")
+    return _plan
@@ -1,27 +1,37 @@
-from tortoise.api import TextToSpeech
-from tortoise.utils.audio import load_audio
 import torchaudio
 import os
 import time
-import torch
 import json
 from pathlib import Path
 import numpy as np
 
+from audio_output import convert_output
+from runtime_config import get_runtime_plan
+from spanish_text import normalize_spanish_text
+from tts_engine import get_engine, list_voice_samples
+from voice_store import STORE_DIR, load_sample
+
 class SpanishTTSColab:
     def __init__(self, voice_dir='voices/custom_voice'):
         """Initialize TTS with Colab optimizations"""
         print("Initializing Spanish TTS system...")
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # Device, precision and threads are picked for the Colab runtime
+        # (fp16 on T4-class GPUs, float32 on CPU-only runtimes)
+        plan = get_runtime_plan()
+        self.device = plan.device
         print(f"Using device: {self.device}")
         
-        self.tts = TextToSpeech(
+        # The engine loads the models once per process, so creating more
+        # SpanishTTSColab instances is cheap
+        self.engine = get_engine(
             use_deepspeed=False,
             kv_cache=True,
-            half=True,
-            device=self.device
+            **plan.engine_settings()
         )
+        self.tts = self.engine.tts
         self.voice_dir = voice_dir
+        # Resampled samples are kept here and memory-mapped on later loads
+        self.store_dir = os.path.join(voice_dir, STORE_DIR)
         self.load_metadata()
         
     def load_metadata(self):
@@ -52,32 +62,7 @@ class SpanishTTSColab:
     
     def preprocess_spanish_text(self, text):
         """Optimize text for Spanish TTS"""
-        # Common Spanish abbreviations
-        abbreviations = {
-            'Sr.': 'Señor',
-            'Sra.': 'Señora',
-            'Dr.': 'Doctor',
-            'Dra.': 'Doctora',
-            'Ud.': 'Usted',
-            'Uds.': 'Ustedes',
-        }
-        
-        # Replace abbreviations
-        for abbr, full in abbreviations.items():
-            text = text.replace(abbr, full)
-        
-        # Add spaces around punctuation
-        text = text.replace(".", " . ")
-        text = text.replace(",", " , ")
-        text = text.replace(";", " ; ")
-        text = text.replace(":", " : ")
-        text = text.replace("?", " ? ")
-        text = text.replace("¿", " ¿ ")
-        text = text.replace("!", " ! ")
-        text = text.replace("¡", " ¡ ")
-        
-        # Clean up spaces
-        return " ".join(text.split())
+        return normalize_spanish_text(text)
     
     def load_voice_samples(self):
         """Load voice samples with Colab optimization"""
@@ -88,7 +73,7 @@ class SpanishTTSColab:
             try:
                 file_path = os.path.join(self.voice_dir, sample["file"])
                 if os.path.exists(file_path):
-                    audio = load_audio(file_path, 22050)
+                    audio = load_sample(file_path, self.store_dir)
                     voice_samples.append(audio)
                     print(f"Loaded {os.path.basename(file_path)}")
             except Exception as e:
@@ -96,17 +81,33 @@ class SpanishTTSColab:
         
         return voice_samples
     
-    def generate_speech(self, text, preset='fast', output_file=None, **kwargs):
-        """Generate Spanish speech with Colab optimization"""
-        # Process text
+    def synthesize(self, text, preset='fast', output='tensor', **kwargs):
+        """
+        Generate Spanish speech in memory
+        :param output: 'tensor', 'numpy', 'pcm' (memoryview of 16-bit PCM) or
+                       encoded bytes: 'wav', 'flac', 'opus', 'mp3'
+        """
         text = self.preprocess_spanish_text(text)
-        print(f"\nProcessing text: '{text}'")
-        
-        # Load samples
-        voice_samples = self.load_voice_samples()
-        if not voice_samples:
+        if not list_voice_samples(self.voice_dir):
             raise ValueError("No voice samples loaded!")
         
+        # Default parameters optimized for Spanish; only the best
+        # candidate is kept, so render just that one
+        params = {
+            'k': 1,
+            'temperature': 0.8,
+            'length_penalty': 1.0,
+        }
+        params.update(kwargs)  # Update with any custom parameters
+        gen = self.engine.synthesize(text, self.voice_dir, preset=preset, **params)
+        if isinstance(gen, list):
+            gen = gen[0]
+        return convert_output(gen, output)
+    
+    def generate_speech(self, text, preset='fast', output_file=None, **kwargs):
+        """Generate Spanish speech with Colab optimization"""
+        print(f"\nProcessing text: '{self.preprocess_spanish_text(text)}'")
+        
         # Set output filename
         if output_file is None:
             timestamp = time.strftime("%Y%m%d_%H%M%S")
@@ -119,29 +120,13 @@ class SpanishTTSColab:
         start_time = time.time()
         
         try:
-            # Default parameters optimized for Spanish
-            params = {
-                'k': 2,
-                'temperature': 0.8,
-                'length_penalty': 1.0,
-            }
-            params.update(kwargs)  # Update with any custom parameters
-            
-            gen = self.tts.tts_with_preset(
-                text,
-                voice_samples=voice_samples,
-                preset=preset,
-                **params
-            )
-            
-            # Process output
-            if isinstance(gen, list):
-                gen = gen[0]
+            # Latents, samples and repeated utterances are all cached by the engine
+            gen = self.synthesize(text, preset, **kwargs)
             
             # Save audio
             torchaudio.save(
                 output_file,
-                gen.squeeze(0).cpu(),
+                gen,
                 24000
             )
             
@@ -154,7 +139,11 @@ class SpanishTTSColab:
             print(f"Error generating speech: {str(e)}")
             return None
 
+_colab_instances = {}
+
 def generate_sample_colab(text, voice_dir='voices/custom_voice', preset='fast', output_file=None):
     """Helper function for easy Colab usage"""
-    tts = SpanishTTSColab(voice_dir)
-    return tts.generate_speech(text, preset, output_file) 
\ No newline at end of file
+    # Reuse one instance per voice; the models themselves are shared by the engine
+    if voice_dir not in _colab_instances:
+        _colab_instances[voice_dir] = SpanishTTSColab(voice_dir)
+    return _colab_instances[voice_dir].generate_speech(text, preset, output_file) 
\ No newline at end of file
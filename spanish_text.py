@@ -0,0 +1,425 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+# Common Spanish abbreviations
+ABBREVIATIONS = {
+    'Sr.': 'Señor',
+    'Sra.': 'Señora',
+    'Srta.': 'Señorita',
+    'Dr.': 'Doctor',
+    'Dra.': 'Doctora',
+    'Ud.': 'Usted',
+    'Uds.': 'Ustedes',
+    'Lic.': 'Licenciado',
+    'Ing.': 'Ingeniero',
+    'Prof.': 'Profesor',
+    'Profa.': 'Profesora',
+    'Av.': 'Avenida',
+    'Avda.': 'Avenida',
+    'EE.UU.': 'Estados Unidos',
+    'aprox.': 'aproximadamente',
+    'etc.': 'etcétera',
+    'pág.': 'página',
+    'núm.': 'número',
+    'tel.': 'teléfono',
+}
+
+UNITS = [
+    'cero', 'uno', 'dos', 'tres', 'cuatro', 'cinco', 'seis', 'siete', 'ocho', 'nueve',
+    'diez', 'once', 'doce', 'trece', 'catorce', 'quince', 'dieciséis', 'diecisiete', 'dieciocho', 'diecinueve',
+    'veinte', 'veintiuno', 'veintidós', 'veintitrés', 'veinticuatro', 'veinticinco', 'veintiséis',
+    'veintisiete', 'veintiocho', 'veintinueve',
+]
+TENS = ['', '', '', 'treinta', 'cuarenta', 'cincuenta', 'sesenta', 'setenta', 'ochenta', 'noventa']
+HUNDREDS = [
+    '', 'ciento', 'doscientos', 'trescientos', 'cuatrocientos', 'quinientos',
+    'seiscientos', 'setecientos', 'ochocientos', 'novecientos',
+]
+MONTHS = [
+    'enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio',
+    'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre',
+]
+ORDINALS = {
+    1: 'primer', 2: 'segund', 3: 'tercer', 4: 'cuart', 5: 'quint',
+    6: 'sext', 7: 'séptim', 8: 'octav', 9: 'noven', 10: 'décim',
+}
+PUNCTUATION = '.,;:?¿!¡'
+
+
+def _below_hundred(n, apocope=False):
+    # apocope: 'un'/'veintiún' instead of 'uno'/'veintiuno' before a noun (mil, millones)
+    if n < 30:
+        if apocope and n == 1:
+            return 'un'
+        if apocope and n == 21:
+            return 'veintiún'
+        return UNITS[n]
+    tens, unit = divmod(n, 10)
+    if not unit:
+        return TENS[tens]
+    return f"{TENS[tens]} y {'un' if apocope and unit == 1 else UNITS[unit]}"
+
+
+def _below_thousand(n, apocope=False):
+    if n == 100:
+        return 'cien'
+    hundreds, rest = divmod(n, 100)
+    parts = []
+    if hundreds:
+        parts.append(HUNDREDS[hundreds])
+    if rest:
+        parts.append(_below_hundred(rest, apocope))
+    return ' '.join(parts)
+
+
+def _below_million(n, apocope=False):
+    thousands, rest = divmod(n, 1000)
+    parts = []
+    if thousands == 1:
+        parts.append('mil')
+    elif thousands:
+        parts.append(f"{_below_thousand(thousands, apocope=True)} mil")
+    if rest:
+        parts.append(_below_thousand(rest, apocope))
+    return ' '.join(parts)
+
+
+def number_to_words(n, apocope=False):
+    """
+    Spell out a non-negative integer in Spanish (long scale: billón = 10^12)
+    :param apocope: 'un'/'veintiún' instead of 'uno'/'veintiuno', as before a noun
+    """
+    if n == 0:
+        return 'cero'
+    parts = []
+    for scale, singular, plural in ((10 ** 12, 'billón', 'billones'), (10 ** 6, 'millón', 'millones')):
+        count, n = divmod(n, scale)
+        if count == 1:
+            parts.append(f"un {singular}")
+        elif count:
+            parts.append(f"{number_to_words(count) if count >= 10 ** 6 else _below_million(count, apocope=True)} {plural}")
+    if n:
+        parts.append(_below_million(n, apocope))
+    return ' '.join(parts)
+
+
+def _digits_to_words(digits):
+    """Read a decimal part: as a number when short, digit by digit otherwise"""
+    if len(digits) <= 2 and not digits.startswith('0'):
+        return number_to_words(int(digits))
+    return ' '.join(UNITS[int(d)] for d in digits)
+
+
+def _read_digits(numeral):
+    """Digit by digit, separators included: '2.0.1' -> 'dos punto cero punto uno'"""
+    return ' '.join({'.': 'punto', ',': 'coma'}.get(char) or UNITS[int(char)] for char in numeral)
+
+
+def _numeral_to_words(numeral, apocope=False):
+    """
+    Spell out a numeral as written in text
+    Dots between groups of three digits ('1.000.000') and two or more comma
+    groups ('1,000,000') are thousands separators; any other single '.' or ','
+    is the decimal point. Numerals that don't parse cleanly ('2.0.1') and ones
+    with leading zeros ('007') are read digit by digit.
+    """
+    match = re.fullmatch(r'(\d{1,3}(?:(\.)\d{3})+|\d{1,3}(?:(,)\d{3}){2,}|\d+)(?:([.,])(\d+))?', numeral)
+    if match is None:
+        return _read_digits(numeral)
+    integer, thousands, decimal_point, decimals = match.group(1), match.group(2) or match.group(3), match.group(4), match.group(5)
+    if decimal_point and decimal_point == thousands or (len(integer) > 1 and integer.startswith('0')):
+        return _read_digits(numeral)
+    words = number_to_words(int(integer.replace('.', '').replace(',', '')), apocope=apocope and not decimals)
+    if decimals:
+        words += f" {'coma' if decimal_point == ',' else 'punto'} {_digits_to_words(decimals)}"
+    return words
+
+
+def _date_to_words(day, month, year):
+    day, month = int(day), int(month)
+    if not (1 <= day <= 31 and 1 <= month <= 12):
+        return None
+    day_words = 'primero' if day == 1 else number_to_words(day)
+    return f"{day_words} de {MONTHS[month - 1]} de {number_to_words(int(year))}"
+
+
+def _time_to_words(hours, minutes):
+    hours_words = 'una' if int(hours) == 1 else number_to_words(int(hours))
+    if int(minutes) == 0:
+        return f"{hours_words} en punto"
+    return f"{hours_words} y {number_to_words(int(minutes))}"
+
+
+_abbreviation_pattern = '|'.join(re.escape(abbr) for abbr in sorted(ABBREVIATIONS, key=len, reverse=True))
+# Abbreviations are matched regardless of case ('Aprox.', 'DR.')
+_abbreviations_lower = {abbr.lower(): expansion for abbr, expansion in ABBREVIATIONS.items()}
+
+# Ordinal suffixes: º/ª and the abbreviated endings ('1er', '3ra', '2do')
+_ordinal_suffix_pattern = '|'.join(['º', 'ª', 'era', 'ero', 'er', 'ra', 'ro', 'da', 'do', 'ta', 'to', 'va', 'vo', 'ma', 'mo', 'na', 'no'])
+FEMININE_ORDINAL_SUFFIXES = {'ª', 'era', 'ra', 'da', 'ta', 'va', 'ma', 'na'}
+# Nouns a number agrees with as 'un'/'veintiún' ("21 mil" -> "veintiún mil")
+_scale_noun = re.compile(r'\s+(?:mil|millón|millones|billón|billones)\b')
+DEGREE_SCALES = {'C': 'centígrados', 'F': 'Fahrenheit'}
+
+# A single matcher for everything the normalizer rewrites; alternatives are
+# tried left to right, so the more specific ones come first
+_normalizer = re.compile(
+    rf'(?<!\w)(?P<abbr>(?i:{_abbreviation_pattern}))'
+    r'|(?<!\d)(?P<date>(?P<day>\d{1,2})/(?P<month>\d{1,2})/(?P<year>\d{4}))(?!\d)'
+    r'|(?<!\d)(?P<time>(?P<hours>[01]?\d|2[0-4]):(?P<minutes>[0-5]\d))(?!\d)'
+    rf'|(?<!\d)(?P<ordinal>(?P<ordinal_value>\d+)\.?(?P<ordinal_suffix>{_ordinal_suffix_pattern}))(?!\w)'
+    r'|(?<!\d)(?P<number>\d+(?:[.,]\d+)*)'
+    r'(?:(?P<percent>\s?%)|(?P<degrees>\s?°(?P<degree_scale>[CF](?!\w))?))?'
+    rf'|(?P<punct>[{re.escape(PUNCTUATION)}])'
+)
+
+
+def _expand(match, space_punctuation):
+    if match.group('abbr'):
+        abbr = match.group('abbr')
+        expansion = _abbreviations_lower[abbr.lower()]
+        if abbr[0].isupper():
+            expansion = expansion[0].upper() + expansion[1:]
+        return expansion
+    if match.group('date'):
+        words = _date_to_words(match.group('day'), match.group('month'), match.group('year'))
+        if words:
+            return words
+        return ' '.join(number_to_words(int(part)) for part in match.group('date').split('/'))
+    if match.group('time'):
+        return _time_to_words(match.group('hours'), match.group('minutes'))
+    if match.group('ordinal'):
+        value = int(match.group('ordinal_value'))
+        suffix = match.group('ordinal_suffix')
+        if value not in ORDINALS:
+            return number_to_words(value)
+        if suffix in FEMININE_ORDINAL_SUFFIXES:
+            return ORDINALS[value] + 'a'
+        if suffix == 'er' and value in (1, 3):
+            # 'primer', 'tercer'
+            return ORDINALS[value]
+        return ORDINALS[value] + 'o'
+    if match.group('number'):
+        numeral = match.group('number')
+        if match.group('degrees'):
+            words = _numeral_to_words(numeral, apocope=True)
+            words += ' grado' if words == 'un' else ' grados'
+            if match.group('degree_scale'):
+                words += f" {DEGREE_SCALES[match.group('degree_scale')]}"
+            return words
+        words = _numeral_to_words(numeral, apocope=bool(_scale_noun.match(match.string, match.end())))
+        if match.group('percent'):
+            words += ' por ciento'
+        return words
+    if match.group('punct'):
+        return f" {match.group('punct')} " if space_punctuation else match.group('punct')
+    return match.group(0)
+
+
+def _replace(match, space_punctuation):
+    words = _expand(match, space_punctuation)
+    if match.group('punct'):
+        return words
+    # Keep the words apart from letters they were glued to ("Dr.García", "MP3")
+    if re.match(r'\w', match.string[match.start() - 1:match.start()]):
+        words = ' ' + words
+    if re.match(r'\w', match.string[match.end():]):
+        words += ' '
+    return words
+
+
+@lru_cache(maxsize=1024)
+def normalize_spanish_text(text, space_punctuation=True):
+    """
+    Normalize Spanish text for TTS in a single pass
+    Expands abbreviations on word boundaries, spells out numbers, dates, times,
+    percentages and ordinals, and (optionally) puts spaces around punctuation.
+    Results are memoized, so repeated prompts cost a dictionary lookup.
+    """
+    text = _normalizer.sub(lambda match: _replace(match, space_punctuation), text)
+    # Clean up spaces
+    return " ".join(text.split())
+
+
+SENTENCE_END = '.?!…'
+CLAUSE_END = ',;:'
+OPENING_QUOTES = '«“'
+CLOSING_QUOTES = '»”'
+
+
+def _is_abbreviation(text, end):
+    """True if the '.' at text[end] belongs to a known abbreviation"""
+    start = end
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    return text[start:end + 1].lstrip('¿¡«“"(').lower() in _abbreviations_lower
+
+
+def split_sentences(text):
+    """
+    Split Spanish text into sentences
+    Ends on . ? ! … (outside quotes), keeps ¿…? and ¡…! together and doesn't
+    break after abbreviations or inside numbers like 3.5.
+    """
+    sentences = []
+    start = 0
+    quote_depth = 0
+    straight_quote_open = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char in OPENING_QUOTES:
+            quote_depth += 1
+        elif char in CLOSING_QUOTES:
+            quote_depth = max(0, quote_depth - 1)
+        elif char == '"':
+            straight_quote_open = not straight_quote_open
+        elif char in SENTENCE_END and quote_depth == 0 and not straight_quote_open:
+            if char == '.' and (_is_abbreviation(text, i) or (i + 1 < len(text) and text[i + 1].isdigit())):
+                i += 1
+                continue
+            # Swallow runs like '?!' or '...' and closing quotes, also when the
+            # normalizer has spaced them out ('mañana . »')
+            end = i + 1
+            while end < len(text):
+                j = end
+                while j < len(text) and text[j] == ' ':
+                    j += 1
+                if j < len(text) and (text[j] in SENTENCE_END or text[j] in CLOSING_QUOTES):
+                    end = j + 1
+                elif j == end and j < len(text) and text[j] in '")':
+                    end = j + 1
+                else:
+                    break
+            at_boundary = end == len(text) or text[end].isspace()
+            if at_boundary:
+                sentences.append(text[start:end].strip())
+                start = end
+            i = end
+            continue
+        i += 1
+    if text[start:].strip():
+        sentences.append(text[start:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+def _attach_punctuation(tokens):
+    """
+    Join tokens that are only punctuation onto their neighbours
+    The normalizer spaces punctuation out ('hola , mundo'); a bare mark joins
+    the previous token, or the next one for opening marks like '¿' and '«',
+    so no chunk ends up as punctuation alone.
+    """
+    joined = []
+    opening = ''
+    for token in tokens:
+        if re.search(r'\w', token):
+            joined.append(f"{opening} {token}" if opening else token)
+            opening = ''
+        elif opening or token[-1] in '¿¡«“(' or not joined:
+            opening = f"{opening} {token}" if opening else token
+        else:
+            joined[-1] = f"{joined[-1]} {token}"
+    if opening:
+        if joined:
+            joined[-1] = f"{joined[-1]} {opening}"
+        else:
+            joined.append(opening)
+    return joined
+
+
+def _split_long(sentence, max_length):
+    """Break a sentence that doesn't fit into clauses, and clauses into evenly sized runs of words"""
+    if len(sentence) <= max_length:
+        return [sentence]
+    clauses = _attach_punctuation(re.split(rf'(?<=[{CLAUSE_END}])\s+', sentence))
+    pieces = []
+    for clause in clauses:
+        if len(clause) <= max_length:
+            pieces.append(clause)
+        else:
+            pieces.extend(_balanced_pack(_attach_punctuation(clause.split()), max_length))
+    return pieces
+
+
+def _pack(units, cap):
+    chunks = []
+    current = ''
+    for unit in units:
+        if current and len(current) + 1 + len(unit) > cap:
+            chunks.append(current)
+            current = unit
+        else:
+            current = f"{current} {unit}" if current else unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _balanced_pack(units, desired_length):
+    """Pack units into as many chunks as packing to desired_length needs, made as even as possible"""
+    if not units:
+        return []
+    # Smallest cap that still needs no more chunks than packing to desired_length
+    target_count = len(_pack(units, desired_length))
+    low = max(len(unit) for unit in units)
+    high = max(low, desired_length)
+    while low < high:
+        middle = (low + high) // 2
+        if len(_pack(units, middle)) <= target_count:
+            high = middle
+        else:
+            low = middle + 1
+    return _pack(units, low)
+
+
+def split_spanish_text(text, desired_length=100, max_length=200):
+    """
+    Split text into chunks for TTS on sentence and clause boundaries
+    Like Tortoise's split_and_recombine_text, but aware of Spanish punctuation
+    and abbreviations. Chunk lengths are balanced: the text is split into as
+    many chunks as packing to desired_length needs, then the chunks are made
+    as even as possible so batched rendering pads less.
+    A sentence that occurs more than once always gets chunks of its own, so
+    every occurrence is chunked the same way and deduplicate_chunks and the
+    audio cache can reuse it; balancing happens between those sentences.
+    :param desired_length: Target chunk length in characters
+    :param max_length: No chunk is longer than this unless a single word is
+    """
+    text = " ".join(text.split())
+    if not text:
+        return []
+    desired_length = min(desired_length, max_length)
+
+    sentences = _attach_punctuation(split_sentences(text))
+    counts = Counter(sentences)
+    chunks = []
+    run = []
+    for sentence in sentences:
+        units = _split_long(sentence, max_length)
+        if counts[sentence] > 1:
+            chunks.extend(_balanced_pack(run, desired_length))
+            chunks.extend(_balanced_pack(units, desired_length))
+            run = []
+        else:
+            run.extend(units)
+    chunks.extend(_balanced_pack(run, desired_length))
+    return chunks
+
+
+def deduplicate_chunks(chunks):
+    """
+    Collapse repeated chunks so each distinct one is rendered once
+    :return: (unique chunks in order of first appearance, index into them for every chunk)
+    """
+    unique = []
+    positions = {}
+    order = []
+    for chunk in chunks:
+        key = " ".join(chunk.split())
+        if key not in positions:
+            positions[key] = len(unique)
+            unique.append(chunk)
+        order.append(positions[key])
+    return unique, order
@@ -1,8 +1,23 @@
 import os
 import json
+import threading
+import uuid
 from pathlib import Path
+
+import numpy as np
+import torch
 from TTS.api import TTS
 
+from audio_output import convert_output
+from latents_cache import compute_cache_key
+from presets import resolve_preset
+from runtime_config import get_runtime_plan
+from spanish_text import normalize_spanish_text
+from tts_engine import list_voice_samples
+from wav_stream import IncrementalWavWriter
+
+SPEAKER_EMBEDDING_CACHE = "speaker_embedding.pth"
+
 class SpanishTTS:
     def __init__(self):
         """Initialize Spanish TTS with voice samples."""
@@ -26,14 +41,93 @@ class SpanishTTS:
         # Load or create metadata
         self.metadata = self.load_or_create_metadata()
         
-        # Initialize TTS with token
+        # Initialize TTS with token, on the GPU when there is one
         print("Loading TTS model (this might take a minute)...")
+        self.device = get_runtime_plan().device
         self.tts = TTS(
             model_name="tts_models/multilingual/multi-dataset/your_tts",
             progress_bar=True
-        ).to("cuda")
+        ).to(self.device)
         print("TTS model loaded successfully!")
 
+        # Speaker embeddings are computed from the samples once and reused
+        self._embedding = None
+        self._embedding_lock = threading.Lock()
+        self._samples = None
+        self._install_embedding_cache()
+
+    def sample_paths(self):
+        """
+        Voice sample paths, listed again only when the samples directory or
+        metadata.json changed
+        """
+        stamp = []
+        for path in (self.samples_dir, os.path.join(self.voice_dir, "metadata.json")):
+            try:
+                stamp.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+        samples = self._samples
+        if samples is None or samples[0] != stamp:
+            samples = (stamp, list_voice_samples(self.voice_dir))
+            self._samples = samples
+        return samples[1]
+
+    def _install_embedding_cache(self):
+        """
+        Route Coqui's speaker encoder through the embedding cache
+        Coqui encodes speaker_wav on every call; requests for exactly this
+        voice's samples are answered from the stored embedding instead.
+        """
+        speaker_manager = self.tts.synthesizer.tts_model.speaker_manager
+        self._encode_speaker = speaker_manager.compute_embedding_from_clip
+
+        def compute_embedding_from_clip(wav_file):
+            if isinstance(wav_file, list) and wav_file == self.sample_paths():
+                return self.speaker_embedding()
+            return self._encode_speaker(wav_file)
+
+        speaker_manager.compute_embedding_from_clip = compute_embedding_from_clip
+
+    def speaker_embedding(self):
+        """
+        Speaker embedding averaged over every voice sample
+        Stored in the voice's cache/ directory and keyed on the content of the
+        samples, so it is only recomputed when they change.
+        """
+        sample_paths = self.sample_paths()
+        key = compute_cache_key(sample_paths, "your_tts")
+        embedding = self._embedding
+        if embedding is not None and embedding[0] == key:
+            return embedding[1]
+        with self._embedding_lock:
+            if self._embedding is not None and self._embedding[0] == key:
+                return self._embedding[1]
+            return self._load_speaker_embedding(sample_paths, key)
+
+    def _load_speaker_embedding(self, sample_paths, key):
+        """Read the stored embedding, or compute and store it"""
+        cache_path = os.path.join(self.cache_dir, SPEAKER_EMBEDDING_CACHE)
+        embedding = None
+        if os.path.exists(cache_path):
+            try:
+                cached = torch.load(cache_path, map_location="cpu", weights_only=False)
+                if cached.get("key") == key:
+                    embedding = cached["embedding"]
+            except Exception as e:
+                print(f"Ignoring unreadable speaker embedding cache: {str(e)}")
+
+        if embedding is None:
+            print(f"Computing speaker embedding from {len(sample_paths)} samples...")
+            # Coqui averages the embeddings of a list of clips
+            embedding = self._encode_speaker(sample_paths)
+            tmp_path = f"{cache_path}.tmp"
+            torch.save({"key": key, "embedding": embedding}, tmp_path)
+            os.replace(tmp_path, cache_path)
+
+        self._embedding = (key, embedding)
+        return embedding
+
     def load_or_create_metadata(self):
         """Load metadata if exists, create default if not."""
         metadata_path = os.path.join(self.voice_dir, "metadata.json")
@@ -84,29 +178,57 @@ class SpanishTTS:
         
         return default_metadata
 
-    def generate_speech(self, text, preset="standard"):
-        """Generate speech from text using specified preset."""
-        if not os.listdir(self.samples_dir):
+    @property
+    def sample_rate(self):
+        return self.tts.synthesizer.output_sample_rate
+
+    def synthesize(self, text, preset="standard", output="numpy"):
+        """
+        Generate speech in memory
+        Safe to call from several threads on one instance.
+        :param preset: A preset from the voice's metadata or any Tortoise preset
+                       name (ultra_fast, fast, standard, high_quality); it is
+                       checked but does not change the YourTTS output
+        :param output: 'numpy' (float32 array), 'tensor', 'pcm' (memoryview of
+                       16-bit PCM) or encoded bytes: 'wav', 'flac', 'opus', 'mp3'
+        :return: Audio at self.sample_rate in the requested form
+        """
+        sample_paths = self.sample_paths()
+        if not sample_paths:
             raise ValueError(
                 f"No voice samples found in {self.samples_dir}. "
                 "Please upload WAV files using the upload interface."
             )
 
-        # Get preset settings
-        settings = self.metadata["settings"]["presets"].get(preset)
-        if not settings:
-            raise ValueError(
-                f"Invalid preset '{preset}'. Available presets: " +
-                ", ".join(self.metadata["settings"]["presets"].keys())
-            )
+        # Only validates the preset (raises for unknown names): YourTTS has no
+        # autoregressive or diffusion stage for its settings to tune
+        resolve_preset(preset, self.metadata["settings"].get("presets", {}))
 
-        # Generate speech
-        output_path = os.path.join(self.voice_dir, "output.wav")
-        self.tts.tts_to_file(
-            text=text,
-            file_path=output_path,
-            speaker_wav=os.path.join(self.samples_dir, os.listdir(self.samples_dir)[0]),
+        wav = self.tts.tts(
+            text=normalize_spanish_text(text, space_punctuation=False),
+            # Every sample conditions the voice; the embedding comes from the cache
+            speaker_wav=sample_paths,
             language="es"
         )
-        
+        wav = np.asarray(wav, dtype=np.float32)
+        return wav if output == "numpy" else convert_output(wav, output, self.sample_rate)
+
+    def generate_speech(self, text, preset="standard", output_path=None):
+        """
+        Generate speech from text using specified preset.
+        Each call writes its own file (under outputs/ unless output_path is
+        given), renamed into place once complete, so concurrent calls never
+        see each other's audio.
+        :return: Path of the WAV file
+        """
+        wav = self.synthesize(text, preset)
+        if output_path is None:
+            output_dir = os.path.join(self.voice_dir, "outputs")
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, f"{uuid.uuid4().hex}.wav")
+
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        with IncrementalWavWriter(tmp_path, self.sample_rate, sample_format='int16') as writer:
+            writer.write(wav)
+        os.replace(tmp_path, output_path)
         return output_path 
\ No newline at end of file
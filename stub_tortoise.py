@@ -0,0 +1,301 @@
+"""
+Lightweight stand-in for the tortoise package
+Small deterministic models behind the same interface the scripts use from
+tortoise.api and tortoise.utils (TextToSpeech, do_spectrogram_diffusion,
+get_voices, load_voices, load_audio, split_and_recombine_text). Every stage
+does real, if tiny, tensor work that grows with the text, so the pipeline
+around the models can be timed on machines without the checkpoints or
+network access. The audio is noise shaped by the text, not speech.
+
+    import stub_tortoise
+    stub_tortoise.install()
+"""
+
+import glob
+import os
+import sys
+import types
+import wave
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from audio_output import StreamingResampler, to_numpy
+from spanish_text import split_spanish_text
+
+MODELS_DIR = os.path.join("cache", "stub_models")
+MODEL_DIM = 64
+MEL_CHANNELS = 100
+NUM_MEL_CODES = 8194
+STOP_MEL_TOKEN = 8193
+STOP_TEXT_TOKEN = 0
+# Mel frames per autoregressive code and waveform samples per mel frame, as in Tortoise
+MEL_FRAMES_PER_CODE = 4
+SAMPLES_PER_FRAME = 256
+
+
+class StubTokenizer:
+    def encode(self, text):
+        return [byte % 255 + 1 for byte in text.encode('utf-8')]
+
+
+class StubAutoregressive(nn.Module):
+    stop_text_token = STOP_TEXT_TOKEN
+    stop_mel_token = STOP_MEL_TOKEN
+    mel_length_compression = 1024
+
+    def __init__(self):
+        super().__init__()
+        self.text_embedding = nn.Embedding(256, MODEL_DIM)
+        self.mel_embedding = nn.Embedding(NUM_MEL_CODES, MODEL_DIM)
+        self.step = nn.Linear(2 * MODEL_DIM, MODEL_DIM)
+        # Sampling from a few codes keeps the output head small
+        self.head = nn.Linear(MODEL_DIM, 256)
+        self.latent = nn.Linear(MODEL_DIM, MODEL_DIM)
+
+    def inference_speech(self, speech_conditioning_latent, text_inputs, do_sample=True, top_p=.8, temperature=.8,
+                         num_return_sequences=1, max_generate_length=None, **hf_generate_kwargs):
+        """Sample mel codes one step at a time; about two codes per text token"""
+        text = self.text_embedding(text_inputs.long()).mean(dim=1)
+        context = (text + speech_conditioning_latent[:, :MODEL_DIM]).repeat_interleave(num_return_sequences, dim=0)
+        length = 2 * text_inputs.shape[-1] + 8
+        if max_generate_length:
+            length = min(length, max_generate_length)
+        state = torch.zeros_like(context)
+        codes = []
+        for _ in range(length):
+            state = torch.tanh(self.step(torch.cat([state, context], dim=-1)))
+            probs = F.softmax(self.head(state) / max(temperature, 1e-3), dim=-1)
+            codes.append(torch.multinomial(probs, 1) if do_sample else probs.argmax(dim=-1, keepdim=True))
+        return torch.cat(codes, dim=-1) + 100
+
+    def forward(self, speech_conditioning_latent, text_inputs, text_lengths, mel_codes, wav_lengths,
+                return_latent=False, clip_inputs=True):
+        """Latents of the chosen codes for the diffusion model"""
+        text = self.text_embedding(text_inputs.long()).mean(dim=1, keepdim=True)
+        mel = self.mel_embedding(mel_codes.clamp(max=NUM_MEL_CODES - 1).long())
+        return self.latent(mel + text + speech_conditioning_latent[:, None, :MODEL_DIM])
+
+
+class StubCLVP(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.text = nn.Embedding(256, MODEL_DIM)
+        self.speech = nn.Embedding(NUM_MEL_CODES, MODEL_DIM)
+
+    def forward(self, text, speech_tokens, return_loss=False):
+        text = F.normalize(self.text(text.long()).mean(dim=1), dim=-1)
+        speech = F.normalize(self.speech(speech_tokens.clamp(max=NUM_MEL_CODES - 1).long()).mean(dim=1), dim=-1)
+        return (text * speech).sum(dim=-1)
+
+
+class StubDiffusion(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conditioning = nn.Linear(MODEL_DIM, MEL_CHANNELS)
+        self.denoise = nn.Conv1d(MEL_CHANNELS, MEL_CHANNELS, 3, padding=1)
+
+    def forward(self, x, conditioning):
+        return self.denoise(x) - conditioning
+
+
+class StubVocoder(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.upsample = nn.Linear(MEL_CHANNELS, SAMPLES_PER_FRAME)
+
+    def inference(self, mel):
+        """(1, channels, frames) mel to a (1, 1, frames * 256) waveform"""
+        frames = self.upsample(mel.transpose(1, 2))
+        return (0.5 * torch.tanh(frames)).reshape(mel.shape[0], 1, -1)
+
+
+class StubAligner:
+    def redact(self, audio, text):
+        return audio
+
+
+class StubDiffuser:
+    def __init__(self, steps):
+        self.steps = steps
+
+
+def load_discrete_vocoder_diffuser(trained_diffusion_steps=4000, desired_diffusion_steps=200, cond_free=True,
+                                   cond_free_k=1):
+    return StubDiffuser(desired_diffusion_steps)
+
+
+def fix_autoregressive_output(codes, stop_token, complain=True):
+    return codes
+
+
+def do_spectrogram_diffusion(diffusion_model, diffuser, latents, conditioning_latents, temperature=1, verbose=True):
+    """Refine noise into a mel spectrogram over the diffuser's steps"""
+    with torch.no_grad():
+        frames = latents.shape[1] * MEL_FRAMES_PER_CODE
+        conditioning = diffusion_model.conditioning(latents + conditioning_latents[:, None, :MODEL_DIM])
+        conditioning = conditioning.repeat_interleave(MEL_FRAMES_PER_CODE, dim=1).transpose(1, 2)
+        mel = torch.randn(latents.shape[0], MEL_CHANNELS, frames) * temperature
+        steps = diffuser.steps if diffuser is not None else 30
+        for _ in range(steps):
+            mel = mel - 0.1 * diffusion_model(mel, conditioning)
+        return mel
+
+
+class TextToSpeech:
+    """Same constructor and tts() signature as tortoise.api.TextToSpeech"""
+
+    def __init__(self, autoregressive_batch_size=None, models_dir=MODELS_DIR, enable_redaction=True,
+                 kv_cache=False, use_deepspeed=False, half=False, device=None, **kwargs):
+        self.models_dir = models_dir
+        self.autoregressive_batch_size = autoregressive_batch_size or 4
+        self.enable_redaction = enable_redaction
+        self.half = half
+        self.device = torch.device(device or 'cpu')
+        self.tokenizer = StubTokenizer()
+        self.aligner = StubAligner()
+        # The same weights on every run
+        with torch.random.fork_rng():
+            torch.manual_seed(0)
+            self.autoregressive = StubAutoregressive().eval()
+            self.clvp = StubCLVP().eval()
+            self.diffusion = StubDiffusion().eval()
+            self.vocoder = StubVocoder().eval()
+            self.conditioning_projection = torch.randn(SAMPLES_PER_FRAME, MODEL_DIM) / SAMPLES_PER_FRAME
+
+    @contextmanager
+    def temporary_cuda(self, model):
+        """Model on self.device for the duration of a stage, like tortoise 3"""
+        yield model.to(self.device)
+        model.cpu()
+
+    def deterministic_state(self, seed=None):
+        seed = int(seed) if seed is not None else 0
+        torch.manual_seed(seed)
+        return seed
+
+    def get_conditioning_latents(self, voice_samples, return_mels=False):
+        """(autoregressive, diffusion) latents from the frame spectra of the samples"""
+        with torch.no_grad():
+            latents = []
+            for sample in voice_samples:
+                sample = torch.as_tensor(sample, dtype=torch.float32).reshape(-1)
+                usable = sample.shape[0] // SAMPLES_PER_FRAME * SAMPLES_PER_FRAME
+                frames = sample[:usable].reshape(-1, SAMPLES_PER_FRAME)
+                spectrum = torch.fft.rfft(frames, n=2 * SAMPLES_PER_FRAME - 2).abs()
+                latents.append((spectrum @ self.conditioning_projection).mean(dim=0))
+            latent = torch.stack(latents).mean(dim=0, keepdim=True) if latents else torch.zeros(1, MODEL_DIM)
+        return latent, latent.flip(-1)
+
+    def tts(self, text, voice_samples=None, conditioning_latents=None, k=1, verbose=True, use_deterministic_seed=None,
+            return_deterministic_state=False, num_autoregressive_samples=512, temperature=.8, length_penalty=1,
+            repetition_penalty=2.0, top_p=.8, max_mel_tokens=500, cvvp_amount=.0, diffusion_iterations=100,
+            cond_free=True, cond_free_k=2, diffusion_temperature=1.0, **hf_generate_kwargs):
+        seed = self.deterministic_state(use_deterministic_seed)
+        if conditioning_latents is not None:
+            auto_conditioning, diffusion_conditioning = conditioning_latents
+        elif voice_samples is not None:
+            auto_conditioning, diffusion_conditioning = self.get_conditioning_latents(voice_samples)
+        else:
+            auto_conditioning = diffusion_conditioning = torch.randn(1, MODEL_DIM)
+        text_tokens = torch.IntTensor(self.tokenizer.encode(text)).unsqueeze(0)
+        diffuser = load_discrete_vocoder_diffuser(desired_diffusion_steps=diffusion_iterations, cond_free=cond_free,
+                                                  cond_free_k=cond_free_k)
+
+        with torch.no_grad():
+            samples = []
+            batch_size = min(self.autoregressive_batch_size, num_autoregressive_samples)
+            for _ in range(max(1, num_autoregressive_samples // batch_size)):
+                samples.append(self.autoregressive.inference_speech(
+                    auto_conditioning, text_tokens, do_sample=True, top_p=top_p, temperature=temperature,
+                    num_return_sequences=batch_size, max_generate_length=max_mel_tokens))
+            samples = torch.cat(samples, dim=0)
+            scores = self.clvp(text_tokens.repeat(samples.shape[0], 1), samples, return_loss=False)
+            best_results = samples[torch.topk(scores, k=min(k, samples.shape[0])).indices]
+            best_latents = self.autoregressive(
+                auto_conditioning.repeat(best_results.shape[0], 1), text_tokens.repeat(best_results.shape[0], 1),
+                torch.tensor([text_tokens.shape[-1]]), best_results,
+                torch.tensor([best_results.shape[-1] * self.autoregressive.mel_length_compression]),
+                return_latent=True, clip_inputs=False)
+
+            wav_candidates = []
+            for b in range(best_results.shape[0]):
+                mel = do_spectrogram_diffusion(self.diffusion, diffuser, best_latents[b].unsqueeze(0),
+                                               diffusion_conditioning, temperature=diffusion_temperature,
+                                               verbose=verbose)
+                wav = self.vocoder.inference(mel)
+                if self.enable_redaction:
+                    wav = self.aligner.redact(wav.squeeze(1), text).unsqueeze(1)
+                wav_candidates.append(wav.cpu())
+
+        result = wav_candidates if len(wav_candidates) > 1 else wav_candidates[0]
+        if return_deterministic_state:
+            return result, (seed, text, voice_samples, conditioning_latents)
+        return result
+
+
+def get_voices(extra_voice_dirs=[]):
+    """Voice name -> sample files, for every sub-directory of the given directories"""
+    voices = {}
+    for voice_root in extra_voice_dirs:
+        for name in sorted(os.listdir(voice_root)):
+            voice_dir = os.path.join(voice_root, name)
+            if os.path.isdir(voice_dir):
+                voices[name] = sorted(glob.glob(os.path.join(voice_dir, '*.wav')))
+    return voices
+
+
+def load_audio(audiopath, sampling_rate):
+    """Mono float tensor of shape (1, samples) at sampling_rate"""
+    try:
+        with wave.open(audiopath, 'rb') as f:
+            if f.getsampwidth() != 2:
+                raise wave.Error("not 16-bit PCM")
+            frames = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').astype(np.float32) / 32768
+            audio = frames.reshape(-1, f.getnchannels()).mean(axis=1)
+            rate = f.getframerate()
+    except wave.Error:
+        import torchaudio
+
+        audio, rate = torchaudio.load(audiopath)
+        audio = audio.mean(dim=0)
+    audio = to_numpy(audio)
+    if rate != sampling_rate:
+        resampler = StreamingResampler(rate, sampling_rate)
+        audio = np.concatenate([resampler.process(audio), resampler.flush()], axis=1)
+    return torch.from_numpy(np.clip(audio, -1, 1))
+
+
+def load_voices(voices, extra_voice_dirs=[]):
+    """(samples, None) for the named voices; (None, None) for 'random'"""
+    if voices == ['random']:
+        return None, None
+    voice_files = get_voices(extra_voice_dirs)
+    samples = []
+    for voice in voices:
+        samples.extend(load_audio(path, 22050) for path in voice_files.get(voice, []))
+    return samples, None
+
+
+def split_and_recombine_text(text, desired_length=200, max_length=300):
+    return split_spanish_text(text, desired_length, max_length)
+
+
+def install():
+    """Register the stub as the tortoise package for every later import"""
+    modules = {name: types.ModuleType(name) for name in (
+        'tortoise', 'tortoise.utils', 'tortoise.utils.audio', 'tortoise.utils.text')}
+    # This module is tortoise.api itself, so anything patched on
+    # tortoise.api is also what TextToSpeech.tts calls
+    api = modules['tortoise.api'] = sys.modules[__name__]
+    for name in ('get_voices', 'load_audio', 'load_voices'):
+        setattr(modules['tortoise.utils.audio'], name, globals()[name])
+    modules['tortoise.utils.text'].split_and_recombine_text = split_and_recombine_text
+    modules['tortoise'].api = api
+    modules['tortoise'].utils = modules['tortoise.utils']
+    modules['tortoise.utils'].audio = modules['tortoise.utils.audio']
+    modules['tortoise.utils'].text = modules['tortoise.utils.text']
+    sys.modules.update(modules)
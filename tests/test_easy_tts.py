@@ -0,0 +1,35 @@
+import os
+import sys
+
+import torch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import easy_tts
+
+
+class StubEngine:
+    def resolve_settings(self, voice, preset, overrides=None):
+        return {'k': 1}
+
+    def cache_key(self, text, voice, preset, settings):
+        return text
+
+
+def test_generate_voice_passes_precision_to_workers(tmp_path, monkeypatch):
+    calls = []
+
+    def render_parallel(texts, voice, preset, workers, tts_kwargs):
+        calls.append(tts_kwargs)
+        for i in range(len(texts)):
+            yield i, torch.zeros(1, 240), None
+
+    monkeypatch.setattr(easy_tts, 'load_engine', lambda warm=True, precision=None: StubEngine())
+    monkeypatch.setattr(easy_tts, 'render_parallel', render_parallel)
+
+    output = easy_tts.generate_voice("Hola. Adiós.", output_filename=str(tmp_path / "out.wav"), chunk_size=8,
+                                     workers=2, precision='float32')
+
+    assert output == str(tmp_path / "out.wav")
+    assert calls == [easy_tts.engine_settings('float32')]
+    assert calls[0]['half'] is False and not calls[0].get('quantize')
@@ -0,0 +1,75 @@
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from spanish_text import deduplicate_chunks, normalize_spanish_text, split_spanish_text
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("3.14159", "tres punto uno cuatro uno cinco nueve"),
+    ("3.141", "tres mil ciento cuarenta y uno"),
+    ("1.234,5", "mil doscientos treinta y cuatro coma cinco"),
+    ("2.0.1", "dos punto cero punto uno"),
+    ("1,000,000", "un millón"),
+    ("007", "cero cero siete"),
+    ("21 mil personas", "veintiún mil personas"),
+    ("2,5%", "dos coma cinco por ciento"),
+])
+def test_numbers(text, expected):
+    assert normalize_spanish_text(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("5°C", "cinco grados centígrados"),
+    ("30°", "treinta grados"),
+    ("1°", "un grado"),
+    ("el 1º", "el primero"),
+    ("la 1ª", "la primera"),
+    ("el 3er piso", "el tercer piso"),
+    ("la 3ra vez", "la tercera vez"),
+    ("el 2do", "el segundo"),
+])
+def test_degrees_and_ordinals(text, expected):
+    assert normalize_spanish_text(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("24:00", "veinticuatro en punto"),
+    ("Aprox. diez", "Aproximadamente diez"),
+    ("Dr.García", "Doctor García"),
+    ("MP3", "MP tres"),
+])
+def test_times_abbreviations_and_spacing(text, expected):
+    assert normalize_spanish_text(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    "3.14159", "2.0.1", "1,000,000", "5°C", "3er", "24:00", "1.000.000.5", "v2.0", "12:345", "1,2,3",
+])
+def test_no_digits_reach_the_output(text):
+    assert not re.search(r'\d', normalize_spanish_text(text))
+
+
+def test_split_never_emits_punctuation_only_chunks():
+    text = "palabra " * 12 + "casa ."
+    chunks = split_spanish_text(text, desired_length=100, max_length=100)
+    assert all(re.search(r'\w', chunk) for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_split_balances_long_sentences():
+    text = ("una frase bastante larga sin ninguna coma que se extiende durante más de cien "
+            "caracteres para poder comprobar el reparto")
+    lengths = [len(chunk) for chunk in split_spanish_text(text, desired_length=100, max_length=100)]
+    assert len(lengths) == 2 and max(lengths) - min(lengths) < 10
+
+
+def test_split_repeated_sentences_dedupe():
+    text = "Hola a todos. Gracias por venir. Esta es otra frase. Gracias por venir. Adiós."
+    unique, order = deduplicate_chunks(split_spanish_text(text, desired_length=30, max_length=60))
+    assert unique.count("Gracias por venir.") == 1
+    assert len(order) == len(unique) + 1
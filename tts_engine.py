@@ -0,0 +1,354 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from audio_cache import AudioCache, synthesis_key
+from batched_tts import plan_batches, tts_batch
+from latents_cache import (
+    compute_cache_key, get_conditioning_latents, get_model_version, load_voice_settings, resolve_cache_path
+)
+from presets import resolve_preset, voice_presets
+from voice_store import STORE_DIR
+
+VOICES_DIR = "tortoise/voices"
+
+
+def list_voice_samples(voice_dir):
+    """
+    Paths of the WAV samples that make up a voice
+    Honours a metadata 'samples' list (Colab layout) or 'samples_dir', and
+    otherwise uses every .wav file in the voice directory.
+    """
+    metadata_path = os.path.join(voice_dir, "metadata.json")
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+    if metadata.get("samples"):
+        paths = [os.path.join(voice_dir, sample["file"]) for sample in metadata["samples"]]
+        return [path for path in paths if os.path.exists(path)]
+
+    samples_dir = os.path.join(voice_dir, metadata.get("samples_dir", ""))
+    if not os.path.isdir(samples_dir):
+        return []
+    return [
+        os.path.join(samples_dir, file)
+        for file in sorted(os.listdir(samples_dir))
+        if file.endswith('.wav')
+    ]
+
+
+def resolve_voice_dir(voice):
+    """Accept either a voice directory or the name of a voice under tortoise/voices"""
+    if os.path.isdir(voice):
+        return voice
+    candidate = os.path.join(VOICES_DIR, voice)
+    if os.path.isdir(candidate):
+        return candidate
+    raise ValueError(f"Voice '{voice}' not found")
+
+
+class Engine:
+    """
+    Long-lived Tortoise TTS engine
+    Loads the models once and keeps per-voice conditioning latents around, so
+    every request after the first only pays for inference.
+    """
+
+    def __init__(self, audio_cache=None, quantize=False, **tts_kwargs):
+        """
+        :param audio_cache: AudioCache to serve repeated utterances from, or None
+        :param quantize: Run the autoregressive model and CLVP with int8 weights (CPU only)
+        :param tts_kwargs: Arguments passed to TextToSpeech (device, half, kv_cache, ...)
+        """
+        self.audio_cache = audio_cache
+        self.quantize = quantize
+        self.tts_kwargs = tts_kwargs
+        self._tts = None
+        self._load_lock = threading.Lock()
+        # Tortoise keeps state on the model objects, so inference is serialized
+        self.inference_lock = threading.RLock()
+        # Futures of utterances being rendered right now, by cache key
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def tts(self):
+        """The TextToSpeech instance, loaded on first use"""
+        if self._tts is None:
+            with self._load_lock:
+                if self._tts is None:
+                    from tortoise.api import TextToSpeech
+
+                    print("Loading Tortoise TTS models (once per process)...")
+                    start_time = time.time()
+                    tts = TextToSpeech(**self.tts_kwargs)
+                    if self.quantize:
+                        from quantization import quantize_tts
+
+                        quantize_tts(tts, self.tts_kwargs.get('models_dir'),
+                                     kv_cache=self.tts_kwargs.get('kv_cache', False),
+                                     use_deepspeed=self.tts_kwargs.get('use_deepspeed', False))
+                    self._tts = tts
+                    print(f"Models loaded in {time.time() - start_time:.1f} seconds")
+        return self._tts
+
+    def conditioning_latents(self, voice):
+        """
+        Conditioning latents for a voice
+        :param voice: Voice directory, voice name, or list of sample paths
+        """
+        if isinstance(voice, (list, tuple)):
+            return get_conditioning_latents(self.tts, list(voice))
+
+        voice_dir = resolve_voice_dir(voice)
+        sample_paths = list_voice_samples(voice_dir)
+        if not sample_paths:
+            raise ValueError(f"No WAV files found in {voice_dir}")
+        cache_path, use_cache = resolve_cache_path(voice_dir, load_voice_settings(voice_dir))
+        return get_conditioning_latents(self.tts, sample_paths, cache_path=cache_path, use_cache=use_cache,
+                                        store_dir=os.path.join(voice_dir, STORE_DIR))
+
+    def voice_id(self, voice):
+        """Identifies a voice by name and the exact content of its samples"""
+        if isinstance(voice, (list, tuple)):
+            name, sample_paths = 'samples', list(voice)
+        else:
+            voice_dir = resolve_voice_dir(voice)
+            name, sample_paths = os.path.basename(os.path.abspath(voice_dir)), list_voice_samples(voice_dir)
+        model_version = get_model_version(self.tts_kwargs.get('models_dir'))
+        return f"{name}:{compute_cache_key(sample_paths, model_version)}"
+
+    def resolve_settings(self, voice, preset, overrides=None):
+        """Concrete generation settings: Tortoise preset, then the voice's metadata preset, then overrides"""
+        voice_dir = None if isinstance(voice, (list, tuple)) else resolve_voice_dir(voice)
+        settings = resolve_preset(preset, voice_presets(voice_dir), overrides)
+        settings.setdefault('k', 1)
+        return settings
+
+    def cache_key(self, text, voice, preset, settings):
+        """Audio cache key for one utterance rendered with these settings"""
+        params = {name: value for name, value in settings.items() if name not in ('use_deterministic_seed', 'verbose')}
+        if self.quantize:
+            # int8 models produce different audio than the full precision ones
+            params['precision'] = 'int8'
+        return synthesis_key(text, self.voice_id(voice), preset, params, settings.get('use_deterministic_seed'))
+
+    def _cached(self, text, voice, preset, settings, use_cache):
+        """
+        (key, cached audio) for an utterance
+        The key is None when the utterance can't be shared (k > 1); the audio is
+        None on a miss or when the audio cache is off.
+        """
+        if settings['k'] != 1:
+            return None, None
+        key = self.cache_key(text, voice, preset, settings)
+        if self.audio_cache is None or not use_cache:
+            return key, None
+        return key, self.audio_cache.get(key)
+
+    def _claim(self, key):
+        """
+        (future, owner) for an utterance about to be rendered
+        The first caller for a key owns the render; callers arriving while it is
+        still in flight get the same future and wait on it instead.
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def inflight(self, text, voice, preset='fast', **kwargs):
+        """
+        Future of an identical utterance that is rendering right now, or None
+        Lets callers that queue work elsewhere (the micro-batch scheduler) join
+        a render already under way instead of waiting their turn to repeat it.
+        """
+        settings = self.resolve_settings(voice, preset, kwargs)
+        if settings['k'] != 1:
+            return None
+        key = self.cache_key(text, voice, preset, settings)
+        with self._inflight_lock:
+            return self._inflight.get(key)
+
+    def _release(self, key, future, audio=None, error=None, use_cache=True):
+        """
+        Store a finished render and hand it to every caller waiting on it
+        Never raises: a failed cache write only costs a later re-render, and the
+        waiting callers must be released either way.
+        """
+        try:
+            if error is None and self.audio_cache is not None and use_cache:
+                self.audio_cache.put(key, audio)
+        except Exception as e:
+            print(f"Warning: Could not write to the audio cache: {str(e)}")
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            if error is None:
+                future.set_result(audio)
+            else:
+                future.set_exception(error)
+
+    def _generate(self, text, latents, settings):
+        """
+        TextToSpeech.tts with resolved settings
+        Voice presets may ask for fewer autoregressive samples than one batch
+        holds, so the batch is shrunk to match for the duration of the call.
+        """
+        tts = self.tts
+        batch_size = tts.autoregressive_batch_size
+        tts.autoregressive_batch_size = min(batch_size, settings['num_autoregressive_samples'])
+        try:
+            return tts.tts(text, conditioning_latents=latents, **settings)
+        finally:
+            tts.autoregressive_batch_size = batch_size
+
+    def _render(self, text, voice, settings):
+        with self.inference_lock:
+            latents = self.conditioning_latents(voice)
+            gen = self._generate(text, latents, settings)
+        if isinstance(gen, list):
+            return [g.squeeze(0).cpu() for g in gen]
+        return gen.squeeze(0).cpu()
+
+    def synthesize(self, text, voice, preset='fast', use_cache=True, **kwargs):
+        """
+        Synthesize text with a voice
+        Identical requests already rendering on another thread are joined
+        rather than rendered twice.
+        :param text: Text to speak
+        :param voice: Voice directory, voice name, or list of sample paths
+        :param preset: Preset name, from Tortoise or the voice's metadata.json
+        :param use_cache: Serve repeated utterances from the audio cache
+        :param kwargs: Tuning overrides and other TextToSpeech.tts arguments (k, temperature, ...)
+        :return: 24 kHz waveform tensor of shape (1, samples) on the CPU,
+                 or a list of them when k > 1
+        """
+        settings = self.resolve_settings(voice, preset, kwargs)
+        key, cached = self._cached(text, voice, preset, settings, use_cache)
+        if cached is not None:
+            return cached
+        if key is None:
+            return self._render(text, voice, settings)
+
+        future, owner = self._claim(key)
+        if not owner:
+            return future.result()
+        try:
+            gen = self._render(text, voice, settings)
+        except Exception as e:
+            self._release(key, future, error=e)
+            raise
+        self._release(key, future, gen, use_cache=use_cache)
+        return gen
+
+    def synthesize_batch(self, texts, voice, preset='fast', batch_size=4, memory_budget_mb=None, use_cache=True,
+                         return_exceptions=False, **kwargs):
+        """
+        Synthesize several chunks, sending up to batch_size of them through the model together
+        Repeated chunks, and chunks already rendering on another thread, are
+        rendered once. When a batch fails, its chunks are rendered one by one,
+        so a bad chunk only fails itself.
+        :param texts: Chunks to speak
+        :param voice: Voice directory, voice name, or list of sample paths
+        :param preset: Preset name, from Tortoise or the voice's metadata.json
+        :param batch_size: Maximum number of chunks per batch
+        :param memory_budget_mb: Close a batch early when its estimated memory goes over this
+        :param use_cache: Serve chunks from the audio cache; only misses are rendered
+        :param return_exceptions: Put a failed chunk's exception in its place instead of raising it
+        :param kwargs: Tuning overrides (temperature, diffusion_iterations, ...)
+        :return: One waveform tensor of shape (1, samples) per chunk, in input order
+        """
+        settings = self.resolve_settings(voice, preset, kwargs)
+        results = [None] * len(texts)
+
+        keys = {}
+        for i, text in enumerate(texts):
+            keys[i], results[i] = self._cached(text, voice, preset, settings, use_cache)
+
+        # Chunks this call renders, and chunks it waits on
+        owned = {}
+        joined = {}
+        for i in range(len(texts)):
+            if results[i] is not None:
+                continue
+            if keys[i] is None:
+                owned[i] = None
+                continue
+            future, owner = self._claim(keys[i])
+            (owned if owner else joined)[i] = future
+
+        pending = list(owned)
+        errors = {}
+        try:
+            if pending:
+                with self.inference_lock:
+                    latents = self.conditioning_latents(voice)
+                    sequences_per_text = min(self.tts.autoregressive_batch_size, settings['num_autoregressive_samples'])
+                    batches = plan_batches([texts[i] for i in pending], batch_size, memory_budget_mb,
+                                           sequences_per_text=sequences_per_text,
+                                           max_mel_tokens=settings['max_mel_tokens'])
+                    for batch in batches:
+                        batch = [pending[i] for i in batch]
+                        gens = None
+                        if len(batch) > 1:
+                            try:
+                                gens = tts_batch(self.tts, [texts[i] for i in batch], latents, **settings)
+                            except (NotImplementedError, AttributeError) as e:
+                                print(f"Batched inference unavailable ({str(e)}), rendering chunks one by one")
+                            except Exception as e:
+                                print(f"Batch of {len(batch)} chunks failed ({str(e)}), rendering them one by one")
+                        for n, i in enumerate(batch):
+                            try:
+                                gen = gens[n] if gens is not None else self._generate(texts[i], latents, settings)
+                            except Exception as e:
+                                errors[i] = e
+                                future = owned.pop(i)
+                                if future is not None:
+                                    self._release(keys[i], future, error=e)
+                                continue
+                            gen = gen[0] if isinstance(gen, list) else gen
+                            results[i] = gen.squeeze(0).cpu()
+                            future = owned.pop(i)
+                            if future is not None:
+                                self._release(keys[i], future, results[i], use_cache=use_cache)
+        except Exception as e:
+            for i, future in owned.items():
+                if future is not None:
+                    self._release(keys[i], future, error=e)
+            raise
+
+        for i, future in joined.items():
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                errors[i] = e
+        if errors and not return_exceptions:
+            raise errors[min(errors)]
+        for i, error in errors.items():
+            results[i] = error
+        return results
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(**tts_kwargs):
+    """
+    Process-wide engine shared by every entry point
+    The first caller decides how the models are loaded; later callers get the
+    same instance.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = Engine(audio_cache=AudioCache(), **tts_kwargs)
+        elif tts_kwargs and dict({'quantize': False}, **tts_kwargs) != dict(_engine.tts_kwargs, quantize=_engine.quantize):
+            print(f"Note: reusing already configured TTS engine {_engine.tts_kwargs}")
+        return _engine
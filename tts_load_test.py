@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Load-test a running tts_server.py with concurrent local clients"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+
+
+def synthesize(base_url, payload, timeout=600):
+    """POST /synthesize; returns (seconds, bytes of audio)"""
+    request = urllib.request.Request(
+        f"{base_url}/synthesize",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    start_time = time.time()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        audio = response.read()
+    return time.time() - start_time, len(audio)
+
+
+def run_load_test(base_url, texts, concurrency=4, requests_per_client=5, voice='juan', preset='ultra_fast'):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(client_idx):
+        for request_idx in range(requests_per_client):
+            text = texts[(client_idx * requests_per_client + request_idx) % len(texts)]
+            try:
+                seconds, _ = synthesize(base_url, {'text': text, 'voice': voice, 'preset': preset})
+                with lock:
+                    latencies.append(seconds)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {str(e)}")
+
+    start_time = time.time()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start_time
+
+    latencies.sort()
+    report = {
+        'requests': len(latencies) + len(errors),
+        'errors': len(errors),
+        'concurrency': concurrency,
+        'elapsed_seconds': elapsed,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+    }
+    if latencies:
+        report.update({
+            'latency_mean': statistics.mean(latencies),
+            'latency_p50': latencies[len(latencies) // 2],
+            'latency_p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'latency_max': latencies[-1],
+        })
+    if errors:
+        report['first_error'] = errors[0]
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send concurrent synthesis requests to a local tts_server.py.')
+    parser.add_argument('--url', default='http://127.0.0.1:5002', help='Server base URL.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of concurrent clients.')
+    parser.add_argument('--requests', type=int, default=5, help='Requests per client.')
+    parser.add_argument('--voice', default='juan', help='Voice to request.')
+    parser.add_argument('--preset', default='ultra_fast', help='Preset to request.')
+    parser.add_argument('texts', nargs='*', help='Texts to cycle through.')
+    args = parser.parse_args()
+
+    texts = args.texts or [
+        "Hola, ¿cómo estás?",
+        "Gracias por llamar, en un momento lo atendemos.",
+        "Su turno es el número 15.",
+    ]
+    print(json.dumps(run_load_test(args.url, texts, args.concurrency, args.requests, args.voice, args.preset), indent=2))
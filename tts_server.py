@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Local HTTP synthesis server
+Keeps the models warm in one process and renders requests from a queue.
+
+Endpoints:
+    GET  /health             Server and queue status
+    POST /synthesize         Render and return the audio (blocks until done)
+    POST /jobs               Queue a job, returns {"job_id": ...}
+    GET  /jobs/<id>          Job status
+    GET  /jobs/<id>/audio    The audio once the job is done
+
+Request body (JSON): {"text": "...", "voice": "juan", "preset": "fast",
+                      "backend": "tortoise" | "yourtts", "params": {...},
+                      "format": "wav" | "pcm" | "flac" | "opus" | "mp3",
+                      "bitrate": "32k", "sample_rate": 16000}
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from audio_output import CONTENT_TYPES, EncodingPipeline, encode_audio
+from batch_scheduler import MicroBatchScheduler
+from presets import TUNING_OPTIONS, resolve_preset, voice_presets
+from runtime_config import get_runtime_plan
+from spanish_text import normalize_spanish_text, split_spanish_text
+from tts_engine import get_engine, resolve_voice_dir
+
+SAMPLE_RATE = 24000
+MAX_FINISHED_JOBS = 1000
+# SpanishTTS's voice; its metadata.json declares the presets the backend accepts
+YOURTTS_VOICE_DIR = "tortoise/voices/juan_es"
+
+
+class Job:
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = 'queued'
+        self.audio = None
+        self.content_type = CONTENT_TYPES.get(request.get('format', 'wav'), 'application/octet-stream')
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        info = {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+        }
+        if self.started:
+            info['queue_seconds'] = self.started - self.created
+        if self.finished:
+            info['render_seconds'] = self.finished - self.started
+        if self.error:
+            info['error'] = self.error
+        return info
+
+
+class SynthesisQueue:
+    """
+    Job queue in front of the warm models
+    Several workers take jobs in arrival order and hand their Tortoise chunks
+    to a micro-batching scheduler, so concurrent short requests share model
+    passes; finished jobs from POST /jobs are kept for polling.
+    """
+
+    def __init__(self, default_voice='juan', default_preset='fast', device=None, workers=4,
+                 batch_window_ms=50, max_batch_size=8, max_batch_chars=None, precision=None):
+        """
+        :param device: Device for inference; detected if None
+        :param precision: 'half', 'float32' or 'int8'; detected for the device if None
+        :param workers: Jobs rendered concurrently (their chunks are batched together)
+        :param batch_window_ms: Longest a chunk waits for others to join its batch
+        :param max_batch_size: Maximum number of chunks per batch
+        :param max_batch_chars: Close a batch once it holds this many characters of text
+        """
+        self.default_voice = default_voice
+        self.default_preset = default_preset
+        self.engine = get_engine(**get_runtime_plan(device=device, precision=precision).engine_settings())
+        self.scheduler = MicroBatchScheduler(self.engine, batch_window_ms, max_batch_size, max_batch_chars)
+        self._yourtts = None
+        self._yourtts_lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._run, name=f'synthesis-worker-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def warm_up(self, backends=('tortoise',)):
+        """Load models (and the default voice) before the first request arrives"""
+        start_time = time.time()
+        if 'tortoise' in backends:
+            self.engine.conditioning_latents(self.default_voice)
+        if 'yourtts' in backends:
+            self.yourtts()
+        print(f"Warm-up completed in {time.time() - start_time:.1f} seconds")
+
+    def yourtts(self):
+        """One warm SpanishTTS shared by every worker"""
+        if self._yourtts is None:
+            with self._yourtts_lock:
+                if self._yourtts is None:
+                    from spanish_tortoise import SpanishTTS
+
+                    self._yourtts = SpanishTTS()
+        return self._yourtts
+
+    def submit(self, request, keep=True):
+        """
+        Queue a request
+        :param keep: Keep the job for polling; synchronous requests that are
+                     answered directly don't need it (nor its audio) kept
+        """
+        if not isinstance(request, dict):
+            raise ValueError("Request body must be a JSON object")
+        text = request.get('text', '')
+        if not isinstance(text, str):
+            raise ValueError("'text' must be a string")
+        if not text.strip():
+            raise ValueError("'text' is required")
+        for name in ('voice', 'preset', 'backend', 'format', 'bitrate'):
+            if name in request and not isinstance(request[name], str):
+                raise ValueError(f"'{name}' must be a string")
+        params = request.get('params', {})
+        if not isinstance(params, dict):
+            raise ValueError("'params' must be an object")
+        for name, value in params.items():
+            if name not in TUNING_OPTIONS:
+                raise ValueError(f"Unknown param '{name}'. Available params: {', '.join(TUNING_OPTIONS)}")
+            if name == 'cond_free' and not isinstance(value, bool):
+                raise ValueError("'cond_free' must be a boolean")
+            if name != 'cond_free' and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"'{name}' must be a number")
+        if request.get('format', 'wav') not in CONTENT_TYPES:
+            raise ValueError(f"'format' must be one of {', '.join(CONTENT_TYPES)}")
+        sample_rate = request.get('sample_rate')
+        # bool is an int subclass, so JSON true would pass as 1
+        if sample_rate is not None and (isinstance(sample_rate, bool) or not isinstance(sample_rate, int)
+                                        or sample_rate <= 0):
+            raise ValueError("'sample_rate' must be a positive integer")
+        # Unknown voices and presets are the client's mistake, not a failed render
+        preset = request.get('preset', self.default_preset)
+        backend = request.get('backend', 'tortoise')
+        if backend == 'tortoise':
+            resolve_preset(preset, voice_presets(resolve_voice_dir(request.get('voice', self.default_voice))))
+        elif backend == 'yourtts':
+            resolve_preset(preset, voice_presets(YOURTTS_VOICE_DIR))
+        else:
+            raise ValueError(f"Unknown backend '{backend}'")
+        job = Job(request)
+        if keep:
+            self.keep(job)
+        self._queue.put(job)
+        return job
+
+    def keep(self, job):
+        """Make a job available for polling"""
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def render(self, request):
+        """Render one request to encoded audio bytes, entirely in memory"""
+        backend = request.get('backend', 'tortoise')
+        preset = request.get('preset', self.default_preset)
+        params = request.get('params', {})
+        fmt = request.get('format', 'wav')
+        bitrate = request.get('bitrate')
+        output_rate = request.get('sample_rate')
+
+        if backend == 'yourtts':
+            yourtts = self.yourtts()
+            return encode_audio(yourtts.synthesize(request['text'], preset), yourtts.sample_rate, fmt,
+                                bitrate, output_rate)
+        if backend != 'tortoise':
+            raise ValueError(f"Unknown backend '{backend}'")
+
+        voice = request.get('voice', self.default_voice)
+        chunks = split_spanish_text(normalize_spanish_text(request['text']))
+        futures = [self.scheduler.submit(chunk, voice, preset, **params) for chunk in chunks]
+        # Each chunk is encoded as soon as it is done, while later ones still render
+        with EncodingPipeline(None, fmt, SAMPLE_RATE, bitrate, output_rate) as pipeline:
+            for future in futures:
+                pipeline.write(future.result())
+        return pipeline.result
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                job.audio = self.render(job.request)
+                job.status = 'done'
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {str(e)}"
+                job.status = 'failed'
+            job.finished = time.time()
+            job.done.set()
+            self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        with self._jobs_lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[job_id]
+
+
+class SynthesisHandler(BaseHTTPRequestHandler):
+    synthesis_queue = None
+    request_timeout = 600
+
+    def _send(self, status, body, content_type='application/json'):
+        if content_type == 'application/json':
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(request, dict):
+            raise ValueError("Request body must be a JSON object")
+        return request
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['health']:
+            return self._send(200, {'status': 'ok', 'queue_depth': self.synthesis_queue.depth(),
+                                    'batching': self.synthesis_queue.scheduler.stats()})
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.synthesis_queue.get(parts[1])
+            if job is None:
+                return self._send(404, {'error': 'unknown job'})
+            if len(parts) == 2:
+                return self._send(200, job.to_dict())
+            if parts[2] == 'audio':
+                if job.status != 'done':
+                    return self._send(409, job.to_dict())
+                return self._send(200, job.audio, job.content_type)
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        try:
+            request = self._read_json()
+            if self.path == '/jobs':
+                job = self.synthesis_queue.submit(request)
+                return self._send(202, job.to_dict())
+            if self.path == '/synthesize':
+                job = self.synthesis_queue.submit(request, keep=False)
+                if not job.done.wait(self.request_timeout):
+                    # Still rendering: the client can poll for it from here on
+                    self.synthesis_queue.keep(job)
+                    return self._send(504, job.to_dict())
+                if job.status != 'done':
+                    return self._send(500, job.to_dict())
+                return self._send(200, job.audio, job.content_type)
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        self._send(404, {'error': 'not found'})
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}")
+
+
+def serve(host='127.0.0.1', port=5002, voice='juan', preset='fast', device=None, warm_up=True, backends=('tortoise',),
+          **queue_kwargs):
+    synthesis_queue = SynthesisQueue(voice, preset, device, **queue_kwargs)
+    if warm_up:
+        synthesis_queue.warm_up(backends)
+    SynthesisHandler.synthesis_queue = synthesis_queue
+    server = ThreadingHTTPServer((host, port), SynthesisHandler)
+    print(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local TTS server that keeps the models loaded between requests.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=5002, help='Port to listen on.')
+    parser.add_argument('--voice', default='juan', help='Default voice (name under tortoise/voices or a directory).')
+    parser.add_argument('--preset', default='fast', help='Default preset.')
+    parser.add_argument('--device', default=None, help='Device for inference, e.g. "cpu". Detected if omitted.')
+    parser.add_argument('--precision', default=None, choices=['float32', 'half', 'int8'],
+                        help='Model precision. Detected for the device if omitted.')
+    parser.add_argument('--backends', default='tortoise',
+                        help='Comma-separated backends to load at startup (tortoise, yourtts).')
+    parser.add_argument('--no-warm-up', action='store_true', help='Load models on the first request instead of at startup.')
+    parser.add_argument('--workers', type=int, default=4, help='Jobs rendered concurrently.')
+    parser.add_argument('--batch-window-ms', type=int, default=50,
+                        help='Longest a chunk waits for other requests to join its batch.')
+    parser.add_argument('--max-batch-size', type=int, default=8, help='Maximum chunks per model batch.')
+    parser.add_argument('--max-batch-chars', type=int, default=None,
+                        help='Close a batch once it holds this many characters of text.')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.voice, args.preset, args.device, not args.no_warm_up, args.backends.split(','),
+          workers=args.workers, batch_window_ms=args.batch_window_ms,
+          max_batch_size=args.max_batch_size, max_batch_chars=args.max_batch_chars, precision=args.precision)
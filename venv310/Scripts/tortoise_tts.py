@@ -3,8 +3,8 @@
 import argparse
 import os
 import sys
-import tempfile
 import time
+from collections import Counter
 
 import torch
 import torchaudio
@@ -13,6 +13,17 @@ from tortoise.api import MODELS_DIR, TextToSpeech
 from tortoise.utils.audio import get_voices, load_voices, load_audio
 from tortoise.utils.text import split_and_recombine_text
 
+# This script lives in venv310/Scripts; make the project modules importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from audio_cache import synthesis_key
+from audio_output import ENCODERS, EncodingPipeline, encode_audio
+from latents_cache import compute_cache_key, get_model_version
+from presets import resolve_preset, tuning_overrides, voice_presets
+from quantization import quantize_tts
+from render_manifest import DONE, FAILED, RenderManifest
+from runtime_config import get_runtime_plan
+from spanish_text import deduplicate_chunks
+
 parser = argparse.ArgumentParser(
     description='TorToiSe is a text-to-speech program that is capable of synthesizing speech '
                 'in multiple voices with realistic prosody and intonation.')
@@ -55,10 +66,11 @@ multi_output_group.add_argument(
     help='How many output candidates to produce per-voice. Note that only the first candidate is used in the combined output.')
 multi_output_group.add_argument(
     '--regenerate', type=str, default=None,
-    help='Comma-separated list of clip numbers to re-generate.')
+    help='Comma-separated list of clip numbers to re-generate; other clips are resumed like --skip-existing.')
 multi_output_group.add_argument(
     '--skip-existing', action='store_true',
-    help='Set to skip re-generating existing clips.')
+    help='Resume an interrupted job: skip clips the job manifest records as rendered from the same text '
+         'and settings, and retry failed ones.')
 
 advanced_group = parser.add_argument_group('advanced options')
 advanced_group.add_argument(
@@ -81,10 +93,22 @@ advanced_group.add_argument(
          'Set this to disable this behavior.')
 advanced_group.add_argument(
     '--device', type=str, default=None,
-    help='Device to use for inference.')
+    help='Device to use for inference. If omitted, the GPU is used when there is one.')
+advanced_group.add_argument(
+    '--precision', type=str, default=None, choices=['float32', 'half', 'int8'],
+    help='Model precision. If omitted, the fastest one for the device is used (half on recent GPUs, float32 on CPU; int8 is faster on CPU but changes the output).')
+advanced_group.add_argument(
+    '--format', type=str, default=None, choices=sorted(ENCODERS),
+    help='Format of the combined output. If omitted, it follows the --output extension (WAV otherwise).')
+advanced_group.add_argument(
+    '--bitrate', type=str, default=None,
+    help='Bitrate of compressed output formats, e.g. 32k.')
+advanced_group.add_argument(
+    '--sample-rate', type=int, default=None,
+    help='Resample the combined output to this rate in Hz (the models produce 24000).')
 advanced_group.add_argument(
     '--batch-size', type=int, default=None,
-    help='Batch size to use for inference. If omitted, the batch size is set based on available GPU memory.')
+    help='Batch size to use for inference. If omitted, the batch size is set based on available memory.')
 
 tuning_group = parser.add_argument_group('tuning options (overrides preset settings)')
 tuning_group.add_argument(
@@ -156,7 +180,8 @@ except SystemExit as e:
     sys.exit(e.code)
 
 extra_voice_dirs = args.voices_dir.split(',') if args.voices_dir else []
-all_voices = sorted(get_voices(extra_voice_dirs))
+voice_files = get_voices(extra_voice_dirs)
+all_voices = sorted(voice_files)
 
 if args.list_voices:
     for v in all_voices:
@@ -203,62 +228,137 @@ if args.play:
     except ImportError:
         parser.error('--play requires pydub to be installed, which can be done with "pip install pydub"')
 
-seed = int(time.time()) if args.seed is None else args.seed
+# Progress of every clip is recorded in the output directory, so an
+# interrupted or partly failed job can be resumed
+manifest = RenderManifest(os.path.join(args.output_dir, 'manifest.json')) if args.output_dir else None
+resuming = manifest is not None and (args.skip_existing or args.regenerate)
+if args.seed is not None:
+    seed = args.seed
+elif resuming and manifest.job.get('seed') is not None:
+    # Resumed clips must be rendered with the seed of the original run
+    seed = manifest.job['seed']
+else:
+    seed = int(time.time())
+if manifest is not None:
+    manifest.job = {'seed': seed, 'preset': args.preset}
+plan = get_runtime_plan(device=args.device, precision=args.precision, ar_batch_size=args.batch_size)
 if not args.quiet:
     print('Loading tts...')
 tts = TextToSpeech(models_dir=args.models_dir, enable_redaction=not args.disable_redaction,
-                   device=args.device, autoregressive_batch_size=args.batch_size)
+                   device=plan.device, autoregressive_batch_size=plan.ar_batch_size, half=plan.precision == 'half')
+if plan.precision == 'int8':
+    quantize_tts(tts, args.models_dir)
 gen_settings = {
     'use_deterministic_seed': seed,
     'verbose': not args.quiet,
     'k': args.candidates,
-    'preset': args.preset,
 }
-tuning_options = [
-    'num_autoregressive_samples', 'temperature', 'length_penalty', 'repetition_penalty', 'top_p',
-    'max_mel_tokens', 'cvvp_amount', 'diffusion_iterations', 'cond_free', 'cond_free_k', 'diffusion_temperature']
-for option in tuning_options:
-    if getattr(args, option) is not None:
-        gen_settings[option] = getattr(args, option)
+overrides = tuning_overrides(args)
+ar_batch_size = tts.autoregressive_batch_size
 total_clips = len(texts) * len(selected_voices)
 regenerate_clips = [int(x) for x in args.regenerate.split(',')] if args.regenerate else None
+# Repeated clips (choruses, disclaimers, ...) are rendered once per voice
+unique_texts, text_order = deduplicate_chunks(texts)
 for voice_idx, voice in enumerate(selected_voices):
+    # Combined output is encoded clip by clip on a background thread while the
+    # next clip renders; only --play still needs the whole waveform in memory
     audio_parts = []
+    writer = None
+    if args.output_dir:
+        combined_path = os.path.join(args.output_dir, f'{"-".join(voice)}_combined.{args.format or "wav"}')
+        writer = EncodingPipeline(combined_path, args.format, 24000, args.bitrate, args.sample_rate)
+    elif args.output:
+        writer = EncodingPipeline(args.output, args.format, 24000, args.bitrate, args.sample_rate)
+
+    def emit(audio):
+        if writer is not None:
+            writer.write(audio)
+        else:
+            audio_parts.append(audio)
+
+    # Presets from the voice's metadata.json sit between the Tortoise preset
+    # and the tuning options given on the command line
+    voice_dir = None
+    if len(voice) == 1 and voice_files.get(voice[0]):
+        voice_dir = os.path.dirname(voice_files[voice[0]][0])
+    voice_settings = resolve_preset(args.preset, voice_presets(voice_dir), overrides)
+    clip_params = dict(voice_settings, k=args.candidates, precision=plan.precision)
+    voice_settings.update(gen_settings)
+    voice_paths = [path for v in voice for path in voice_files.get(v, [])]
+    voice_id = f'{"-".join(voice)}:{compute_cache_key(voice_paths, get_model_version(args.models_dir))}'
+    tts.autoregressive_batch_size = min(ar_batch_size, voice_settings['num_autoregressive_samples'])
+
     voice_samples, conditioning_latents = load_voices(voice, extra_voice_dirs)
+    # Candidates of repeated clips, kept until their last occurrence
+    rendered = {}
+    remaining = Counter(text_order)
+    render_start_time = time.time()
     for text_idx, text in enumerate(texts):
         clip_name = f'{"-".join(voice)}_{text_idx:02d}'
-        if args.output_dir:
-            first_clip = os.path.join(args.output_dir, f'{clip_name}_00.wav')
-            if (args.skip_existing or (regenerate_clips and text_idx not in regenerate_clips)) and os.path.exists(first_clip):
-                audio_parts.append(load_audio(first_clip, 24000))
+        clip_key = synthesis_key(text, voice_id, args.preset, clip_params, seed)
+        unique_idx = text_order[text_idx]
+        remaining[unique_idx] -= 1
+        gen = rendered.get(unique_idx) if remaining[unique_idx] else rendered.pop(unique_idx, None)
+        resumed = False
+        if gen is not None:
+            if not args.quiet:
+                print(f'Reusing {clip_name}, same text as an earlier clip')
+        elif resuming and not (regenerate_clips and text_idx in regenerate_clips):
+            paths = manifest.completed(clip_name, text, clip_key)
+            if paths:
+                gen = [load_audio(path, 24000) for path in paths]
+                resumed = True
                 if not args.quiet:
-                    print(f'Skipping {clip_name}')
+                    print(f'Skipping {clip_name}, already rendered')
+        if gen is None:
+            if not args.quiet:
+                print(f'Rendering {clip_name} ({(voice_idx * len(texts) + text_idx + 1)} of {total_clips})...')
+                print('  ' + text)
+            try:
+                gen = tts.tts(
+                    text, voice_samples=voice_samples, conditioning_latents=conditioning_latents, **voice_settings)
+            except Exception as e:
+                if manifest is None:
+                    raise
+                # Keep going; the clip is retried when the job is resumed
+                print(f'Failed to render {clip_name}: {type(e).__name__}: {str(e)}')
+                manifest.record(clip_name, text, clip_key, FAILED, error=str(e), params=clip_params)
                 continue
-        if not args.quiet:
-            print(f'Rendering {clip_name} ({(voice_idx * len(texts) + text_idx + 1)} of {total_clips})...')
-            print('  ' + text)
-        gen = tts.tts_with_preset(
-            text, voice_samples=voice_samples, conditioning_latents=conditioning_latents, **gen_settings)
-        gen = gen if args.candidates > 1 else [gen]
+            gen = gen if args.candidates > 1 else [gen]
+            gen = [audio.squeeze(0).cpu() for audio in gen]
+        if remaining[unique_idx]:
+            rendered[unique_idx] = gen
+        paths = []
         for candidate_idx, audio in enumerate(gen):
-            audio = audio.squeeze(0).cpu()
             if candidate_idx == 0:
-                audio_parts.append(audio)
+                emit(audio)
             if args.output_dir:
-                filename = f'{clip_name}_{candidate_idx:02d}.wav'
-                torchaudio.save(os.path.join(args.output_dir, filename), audio, 24000)
+                paths.append(os.path.join(args.output_dir, f'{clip_name}_{candidate_idx:02d}.wav'))
+                if not resumed:
+                    torchaudio.save(paths[-1], audio, 24000)
+        if manifest is not None:
+            manifest.record(clip_name, text, clip_key, DONE, paths, params=clip_params)
 
-    audio = torch.cat(audio_parts, dim=-1)
-    if args.output_dir:
-        filename = f'{"-".join(voice)}_combined.wav'
-        torchaudio.save(os.path.join(args.output_dir, filename), audio, 24000)
-    elif args.output:
-        filename = args.output if args.output else os.tmp
-        torchaudio.save(args.output, audio, 24000)
+    if manifest is not None:
+        clip_names = {f'{"-".join(voice)}_{text_idx:02d}' for text_idx in range(len(texts))}
+        failed = manifest.statuses(clip_names).get(FAILED, 0)
+        if failed:
+            print(f'{failed} clip(s) failed and are missing from the combined output; '
+                  f'run again with --skip-existing to retry them')
+    if len(unique_texts) < len(texts) and not args.quiet:
+        rendered_chars = sum(len(text) for text in unique_texts)
+        repeated_chars = sum(len(text) for text in texts) - rendered_chars
+        elapsed = time.time() - render_start_time
+        print(f'Reused {len(texts) - len(unique_texts)} repeated clips ({repeated_chars} characters), '
+              f'saving about {elapsed * repeated_chars / rendered_chars:.1f} seconds of synthesis')
+
+    if writer is not None:
+        writer.close()
     elif args.play:
-        f = tempfile.NamedTemporaryFile(suffix='.wav', delete=True)
-        torchaudio.save(f.name, audio, 24000)
-        pydub.playback.play(pydub.AudioSegment.from_wav(f.name))
+        # Played straight from memory as 16-bit PCM, no temporary WAV
+        audio = torch.cat(audio_parts, dim=-1)
+        pydub.playback.play(pydub.AudioSegment(
+            data=encode_audio(audio, 24000, 'pcm'), sample_width=2, frame_rate=24000, channels=1))
 
     if args.produce_debug_state:
         os.makedirs('debug_states', exist_ok=True)
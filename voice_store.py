@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import torch
+
+from latents_cache import file_digest
+
+SAMPLE_RATE = 22050
+STORE_DIR = os.path.join("cache", "samples")
+
+
+def default_store_dir(sample_path):
+    """Store next to the sample when the caller doesn't name a voice-level store"""
+    return os.path.join(os.path.dirname(sample_path), STORE_DIR)
+
+
+def store_path(sample_path, store_dir, sample_rate=SAMPLE_RATE):
+    """Where the preprocessed copy of a sample lives; the name changes with the sample's content"""
+    stem = os.path.splitext(os.path.basename(sample_path))[0]
+    return os.path.join(store_dir, f"{stem}-{sample_rate}-{file_digest(sample_path)[:16]}.npy")
+
+
+def _remove_stale(current_path):
+    """Drop preprocessed copies of older versions of the same sample"""
+    store_dir, current = os.path.split(current_path)
+    prefix = current[:-len("0123456789abcdef.npy")]
+    for name in os.listdir(store_dir):
+        if name != current and name.startswith(prefix) and len(name) == len(current) and name.endswith('.npy'):
+            os.remove(os.path.join(store_dir, name))
+
+
+def load_sample(sample_path, store_dir=None, sample_rate=SAMPLE_RATE):
+    """
+    Load a voice sample through the on-disk store
+    The first load decodes and resamples the WAV with Tortoise's load_audio and
+    saves the float32 result as .npy; every later load memory-maps that file.
+    :return: Float tensor of shape (1, samples) at sample_rate
+    """
+    store_dir = store_dir or default_store_dir(sample_path)
+    path = store_path(sample_path, store_dir, sample_rate)
+
+    if not os.path.exists(path):
+        from tortoise.utils.audio import load_audio
+
+        audio = load_audio(sample_path, sample_rate)
+        os.makedirs(store_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, audio.numpy().astype(np.float32))
+        os.replace(tmp_path, path)
+        _remove_stale(path)
+
+    # Copy-on-write mapping: pages are shared with the page cache and never
+    # copied unless something writes to the tensor
+    return torch.from_numpy(np.load(path, mmap_mode='c'))
+
+
+def load_samples(sample_paths, store_dir=None, sample_rate=SAMPLE_RATE):
+    """Load several samples through the store, skipping (and reporting) unreadable ones"""
+    voice_samples = []
+    for path in sample_paths:
+        try:
+            voice_samples.append(load_sample(path, store_dir, sample_rate))
+        except Exception as e:
+            print(f"Warning: Could not load {os.path.basename(path)}: {str(e)}")
+    return voice_samples
@@ -0,0 +1,117 @@
+import struct
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+
+class IncrementalWavWriter:
+    """
+    WAV writer that appends audio as it is produced
+    The header is patched after every write, so the file is a valid WAV at any
+    point and can be played while the rest of the job is still rendering.
+
+    with IncrementalWavWriter("out.wav", 24000) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    """
+
+    def __init__(self, path, sample_rate=24000, channels=1, sample_format='float32'):
+        """
+        :param path: Output file, or a seekable binary file object (left open on close)
+        :param sample_rate: Sample rate in Hz
+        :param channels: Number of channels
+        :param sample_format: 'float32' (what torchaudio.save writes for float tensors) or 'int16'
+        """
+        if sample_format not in ('float32', 'int16'):
+            raise ValueError(f"Unsupported sample format '{sample_format}'")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self.bytes_per_sample = 4 if sample_format == 'float32' else 2
+        self.frames_written = 0
+        self._data_bytes = 0
+        self._owns_file = not hasattr(path, 'write')
+        self._file = open(path, 'wb') if self._owns_file else path
+        self._write_header()
+
+    @property
+    def duration(self):
+        """Seconds of audio written so far"""
+        return self.frames_written / self.sample_rate
+
+    def _write_header(self):
+        is_float = self.sample_format == 'float32'
+        block_align = self.channels * self.bytes_per_sample
+        fmt_chunk = struct.pack(
+            '<HHIIHH',
+            WAVE_FORMAT_IEEE_FLOAT if is_float else WAVE_FORMAT_PCM,
+            self.channels,
+            self.sample_rate,
+            self.sample_rate * block_align,
+            block_align,
+            self.bytes_per_sample * 8
+        )
+        header = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt_chunk)) + fmt_chunk
+        if is_float:
+            # Non-PCM formats carry a 'fact' chunk with the frame count
+            header += b'fact' + struct.pack('<II', 4, self.frames_written)
+            self._fact_offset = 8 + len(header) - 4
+        header += b'data' + struct.pack('<I', self._data_bytes)
+        self._file.seek(0)
+        self._file.write(b'RIFF' + struct.pack('<I', len(header) + self._data_bytes) + header)
+        self._data_offset = 8 + len(header)
+
+    def _update_sizes(self):
+        riff_size = self._data_offset - 8 + self._data_bytes
+        self._file.seek(4)
+        self._file.write(struct.pack('<I', riff_size))
+        if self.sample_format == 'float32':
+            self._file.seek(self._fact_offset)
+            self._file.write(struct.pack('<I', self.frames_written))
+        self._file.seek(self._data_offset - 4)
+        self._file.write(struct.pack('<I', self._data_bytes))
+        self._file.seek(0, 2)
+
+    def write(self, audio):
+        """
+        Append audio
+        :param audio: Tensor or array shaped (channels, samples) or (samples,), float in [-1, 1]
+        """
+        if hasattr(audio, 'detach'):
+            audio = audio.detach().cpu().numpy()
+        audio = np.asarray(audio)
+        if audio.ndim == 1:
+            audio = audio[np.newaxis, :]
+        audio = audio.reshape(-1, audio.shape[-1])
+        if audio.shape[0] != self.channels:
+            raise ValueError(f"Expected {self.channels} channel(s), got {audio.shape[0]}")
+
+        if self.sample_format == 'float32':
+            frames = audio.T.astype('<f4')
+        else:
+            frames = (np.clip(audio.T, -1.0, 1.0) * 32767).astype('<i2')
+        data = frames.tobytes()
+
+        self._file.seek(0, 2)
+        self._file.write(data)
+        self._data_bytes += len(data)
+        self.frames_written += audio.shape[1]
+        self._update_sizes()
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._update_sizes()
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()